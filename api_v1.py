@@ -0,0 +1,155 @@
+"""JSON API（/api/v1）：书籍、稿费、签约申请、站内通知
+
+路由在 app.py 中，这里负责资源定义与查询拼装：
+- fields=id,title 只查询并返回需要的列（id 总是包含，用作翻页游标）；
+- 列表按 id 倒序，用与页面相同的游标分页（before / after / per_page）；
+- ids=1,2,3 一次取回多条记录，一条 IN 查询；
+- 作者只能看到自己的数据，管理员可以看到全部（通知始终只返回自己的）。
+"""
+import exports
+from db_hybrid import adapt_query, in_clause, execute_query_all
+
+# 批量取回时最多的 id 数（与列表每页上限一致）
+MAX_IDS = 200
+
+# 名称 -> FROM 子句、id 列、可选字段 {字段名: SQL 表达式}、归属列、可用的筛选条件 {参数名: SQL 条件}
+RESOURCES = {
+    "books": {
+        "from": "FROM books b LEFT JOIN users u ON b.author_id=u.id",
+        "id": "b.id",
+        "fields": {
+            "id": "b.id", "title": "b.title", "pen_name": "b.pen_name", "author_id": "b.author_id",
+            "author": "u.username", "contract_type": "b.contract_type", "buyout_amount": "b.buyout_amount",
+            "created_at": "b.created_at",
+        },
+        "owner": "b.author_id",
+        "filters": {"contract_type": "b.contract_type = ?", "author_id": "b.author_id = ?"},
+    },
+    "royalties": {
+        "from": "FROM royalties r LEFT JOIN books b ON r.book_id=b.id LEFT JOIN users u ON r.author_id=u.id",
+        "id": "r.id",
+        "fields": {
+            "id": "r.id", "month": "r.month", "book_id": "r.book_id", "title": "b.title",
+            "author_id": "r.author_id", "author": "u.username", "amount": "r.amount",
+        },
+        "owner": "r.author_id",
+        "filters": {
+            "month": "r.month = ?", "from": "r.month >= ?", "to": "r.month <= ?",
+            "book_id": "r.book_id = ?", "author_id": "r.author_id = ?",
+        },
+    },
+    "applications": {
+        "from": "FROM applications a LEFT JOIN users u ON a.author_id=u.id LEFT JOIN users r ON a.reviewer_id=r.id",
+        "id": "a.id",
+        "fields": {
+            "id": "a.id", "author_id": "a.author_id", "author": "u.username", "title": "a.title",
+            "pen_name": "a.pen_name", "contract_type": "a.contract_type", "status": "a.status",
+            "reject_reason": "a.reject_reason", "created_at": "a.created_at", "processed_at": "a.processed_at",
+            "reviewer": "r.username",
+        },
+        "owner": "a.author_id",
+        "filters": {"status": "a.status = ?", "author_id": "a.author_id = ?"},
+    },
+    "notifications": {
+        "from": "FROM notifications n",
+        "id": "n.id",
+        "fields": {"id": "n.id", "message": "n.message", "created_at": "n.created_at", "is_read": "n.is_read"},
+        "owner": "n.recipient_id",
+        "filters": {},
+        # SQLite 返回 0/1，统一输出为 true/false
+        "booleans": {"is_read"},
+        # 管理员也只能看到自己的通知
+        "private": True,
+    },
+}
+
+
+# 值必须是整数的筛选参数（PostgreSQL 下把字符串与整数列比较会报错）
+INTEGER_FILTERS = {"author_id", "book_id"}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def get_resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError(f"unknown resource: {name}", 404)
+    return resource
+
+
+def parse_fields(resource, raw):
+    """解析 fields 参数，返回字段名列表（id 在最前）；未指定时返回全部字段"""
+    available = resource["fields"]
+    if not raw:
+        return list(available)
+    requested = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in available]
+    if unknown:
+        raise ApiError(f"unknown fields: {', '.join(unknown)}")
+    return ["id"] + [f for f in dict.fromkeys(requested) if f != "id"]
+
+
+def parse_ids(raw):
+    try:
+        ids = list(dict.fromkeys(int(v) for v in raw.split(",") if v.strip()))
+    except ValueError:
+        raise ApiError("ids must be comma-separated integers")
+    if not ids:
+        raise ApiError("ids is empty")
+    if len(ids) > MAX_IDS:
+        raise ApiError(f"at most {MAX_IDS} ids per request")
+    return ids
+
+
+def select_sql(resource, fields):
+    """不含 WHERE / ORDER BY 的查询，第一列为 id（供 fetch_keyset_page 使用）"""
+    columns = ", ".join(resource["fields"][f] for f in fields)
+    return f"SELECT {columns} {resource['from']}"
+
+
+def conditions(resource, args, user_id, role):
+    """访问范围与筛选参数组成的 (WHERE 条件, 参数)；未知的筛选参数被忽略，整数参数格式错误时抛出 ApiError"""
+    parts = []
+    params = []
+    if role != "admin" or resource.get("private"):
+        parts.append(f"{resource['owner']} = ?")
+        params.append(user_id)
+    for key, condition in resource["filters"].items():
+        value = args.get(key)
+        if value:
+            if key in INTEGER_FILTERS:
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ApiError(f"{key} must be an integer")
+            parts.append(condition)
+            params.append(value)
+    return " AND ".join(parts), params
+
+
+def fetch_ids(conn, resource, fields, where, params, ids):
+    """按 id 批量取回（一条 IN 查询），结果按请求的 id 顺序排列，并返回不存在或无权访问的 id"""
+    ids_sql, ids_params = in_clause(resource["id"], ids)
+    query = f"{select_sql(resource, fields)} WHERE {ids_sql}"
+    if where:
+        query += f" AND {where}"
+    rows = {row[0]: row for row in execute_query_all(conn, adapt_query(query), ids_params + list(params))}
+    return [rows[i] for i in ids if i in rows], [i for i in ids if i not in rows]
+
+
+def _plain(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return exports.json_value(value)
+
+
+def serialize(resource, fields, rows):
+    booleans = resource.get("booleans", ())
+    return [
+        {f: (bool(v) if f in booleans and v is not None else _plain(v)) for f, v in zip(fields, row)}
+        for row in rows
+    ]
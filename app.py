@@ -1,73 +1,177 @@
 
 import os
 import sqlite3
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory
-from werkzeug.security import generate_password_hash, check_password_hash
+import hashlib
+import hmac
+import time
+from datetime import datetime, timezone
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, make_response, g, abort, Response, before_render_template, template_rendered
 from dotenv import load_dotenv
 from functools import wraps
 
 # 使用混合数据库配置（本地SQLite，生产PostgreSQL）
-from db_hybrid import get_db, init_db, seed_admin_user, add_reviewer_field, POSTGRES_AVAILABLE
-
-def execute_query(conn, query, params=None):
-	"""执行数据库查询，兼容PostgreSQL和SQLite"""
-	if POSTGRES_AVAILABLE and IS_VERCEL:
-		# PostgreSQL查询
-		with conn.cursor() as cur:
-			cur.execute(query, params or ())
-			return cur.fetchone()
-	else:
-		# SQLite查询
-		return conn.execute(query, params or ()).fetchone()
-
-def execute_query_all(conn, query, params=None):
-	"""执行数据库查询并返回所有结果，兼容PostgreSQL和SQLite"""
-	if POSTGRES_AVAILABLE and IS_VERCEL:
-		# PostgreSQL查询
-		with conn.cursor() as cur:
-			cur.execute(query, params or ())
-			return cur.fetchall()
+from db_hybrid import (
+	get_db, pool_stats, transaction, adapt_query, in_clause,
+	execute_query, execute_query_all, execute_update, execute_batch,
+	POSTGRES_AVAILABLE,
+)
+from db_migrations import ensure_schema, schema_ready
+import royalty_import
+import royalty_rollups
+import view_cache
+import change_stamps
+import assets
+import compression
+import exports
+import passwords
+import ratelimit
+import notifications
+import outbox
+import notification_stream
+import api_v1
+import metrics
+import slow_query
+
+# 列表页分页：每页条数默认值与上限
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def get_page_args():
+	"""读取分页参数：before（取id更小的一页）、after（取id更大的一页）、per_page"""
+	def as_int(name):
+		try:
+			return int(request.args.get(name))
+		except (TypeError, ValueError):
+			return None
+	per_page = as_int("per_page") or DEFAULT_PAGE_SIZE
+	per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+	return as_int("before"), as_int("after"), per_page
+
+def fetch_keyset_page(conn, select_sql, id_column, where=None, params=(), sort=None):
+	"""按id倒序的游标分页：WHERE id < :cursor ORDER BY id DESC LIMIT n
+
+	select_sql 为不含 WHERE/ORDER BY 的查询，第一列必须是id；占位符统一写 ?。
+	sort=(列, 该列在结果中的位置) 时先按该列升序、再按id倒序排列，游标为 (该列的值, id)，
+	值通过 key 参数传递。
+	多取一行用来判断是否还有下一页，返回 {"rows", "prev", "next", "per_page", "prev_args", "next_args"}，
+	prev/next 为翻页用的游标（None表示没有上一页/下一页），prev_args/next_args 为翻页链接的
+	查询参数（保留当前页的其他参数）。
+	"""
+	before, after, per_page = get_page_args()
+	key = request.args.get("key")
+	if sort and key is None:
+		before = after = None
+	conditions = [where] if where else []
+	params = list(params)
+	if after is not None:
+		if sort:
+			conditions.append(f"({sort[0]} < ? OR ({sort[0]} = ? AND {id_column} > ?))")
+			params.extend([key, key, after])
+		else:
+			conditions.append(f"{id_column} > ?")
+			params.append(after)
+		order = f"{sort[0]} DESC, {id_column} ASC" if sort else f"{id_column} ASC"
 	else:
-		# SQLite查询
-		return conn.execute(query, params or ()).fetchall()
-
-def execute_update(conn, query, params=None):
-	"""执行数据库更新操作，兼容PostgreSQL和SQLite"""
-	if POSTGRES_AVAILABLE and IS_VERCEL:
-		# PostgreSQL查询
-		with conn.cursor() as cur:
-			cur.execute(query, params or ())
+		if before is not None:
+			if sort:
+				conditions.append(f"({sort[0]} > ? OR ({sort[0]} = ? AND {id_column} < ?))")
+				params.extend([key, key, before])
+			else:
+				conditions.append(f"{id_column} < ?")
+				params.append(before)
+		order = f"{sort[0]} ASC, {id_column} DESC" if sort else f"{id_column} DESC"
+	query = select_sql
+	if conditions:
+		query += " WHERE " + " AND ".join(conditions)
+	query += f" ORDER BY {order} LIMIT {per_page + 1}"
+	rows = list(execute_query_all(conn, adapt_query(query), params))
+	has_more = len(rows) > per_page
+	rows = rows[:per_page]
+	if after is not None:
+		# 向前翻页时按相反顺序取出，展示前恢复
+		rows.reverse()
+		prev_row = rows[0] if rows and has_more else None
+		next_row = rows[-1] if rows else None
 	else:
-		# SQLite查询
-		conn.execute(query, params or ())
-		conn.commit()
+		prev_row = rows[0] if rows and before is not None else None
+		next_row = rows[-1] if rows and has_more else None
+
+	other_args = {k: v for k, v in request.args.items() if k not in ("before", "after", "key", "per_page")}
+
+	def link_args(direction, row):
+		if row is None:
+			return None
+		args = dict(other_args, per_page=per_page)
+		args[direction] = row[0]
+		if sort:
+			args["key"] = row[sort[1]]
+		return args
+
+	return {
+		"rows": rows,
+		"prev": prev_row[0] if prev_row else None,
+		"next": next_row[0] if next_row else None,
+		"per_page": per_page,
+		"prev_args": link_args("after", prev_row),
+		"next_args": link_args("before", next_row),
+	}
 
 load_dotenv()
 
 # 检测是否在Vercel环境中运行
 IS_VERCEL = os.getenv("VERCEL") is not None
 
-app = Flask(__name__, static_folder='static', static_url_path='/static')
+# 静态文件由下面的 static 路由发送（指纹文件名、预压缩、缓存头），不使用Flask内置的处理
+app = Flask(__name__, static_folder=None)
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-change-me")
+# 压缩 HTML / JSON 响应（级别与最小长度见 compression.py）
+app.wsgi_app = compression.CompressionMiddleware(app.wsgi_app)
+# JSON 响应中的中文不转义为 \uXXXX，体积约为转义后的一半
+app.json.ensure_ascii = False
+
+@app.before_request
+def start_request_timer():
+	g.request_started = time.perf_counter()
 
-_initialized = False
 
 @app.before_request
 def ensure_db_once():
-	global _initialized
-	if not _initialized:
+	# 建表、加字段、创建默认管理员等都由 db_migrations 中的迁移完成，
+	# 这里只在每个进程第一次请求时读取一次 schema_version（结果在进程内缓存）
+	if not schema_ready():
 		try:
-			init_db()
-			# 创建默认管理员用户
-			seed_admin_user()
-			# 添加审核者字段（如果不存在）
-			add_reviewer_field()
-			_initialized = True
+			ensure_schema()
 		except Exception as e:
 			app.logger.error(f"Database initialization failed: {e}")
-			flash("数据库初始化失败，请联系管理员", "error")
-			return render_template("500.html"), 500
+			# 健康检查照常返回，由它报告未就绪
+			if request.endpoint != "health_check":
+				flash("数据库初始化失败，请联系管理员", "error")
+				return render_template("500.html"), 500
+	# 通知分发线程（OUTBOX_DISPATCH=thread 时），fork 出的 worker 在第一次请求时启动
+	outbox.ensure_dispatcher()
+
+
+@app.after_request
+def record_request_metrics(response):
+	# 流式响应（导出、SSE）只计到开始发送为止
+	started = g.get("request_started")
+	if started is not None:
+		endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+		metrics.REQUEST_DURATION.observe(time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+	metrics.maybe_flush()
+	return response
+
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+	g.setdefault("template_started", []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def record_template_metrics(sender, template, context, **extra):
+	started = g.get("template_started")
+	if started:
+		metrics.TEMPLATE_RENDER.observe(time.perf_counter() - started.pop(), template.name or "<string>")
 
 
 def login_required(role=None):
@@ -86,6 +190,97 @@ def login_required(role=None):
 	return decorator
 
 
+def _build_id():
+	"""模板、视图代码与静态资源清单的摘要，部署新版本后旧的 ETag 自动失效"""
+	digest = hashlib.sha1()
+	base = os.path.dirname(os.path.abspath(__file__))
+	paths = [os.path.join(base, "app.py"), os.path.join(assets.STATIC_DIR, assets.DIST_DIR, assets.MANIFEST_NAME)]
+	for root, _, files in os.walk(os.path.join(base, "templates")):
+		paths.extend(os.path.join(root, name) for name in files)
+	for path in sorted(paths):
+		if os.path.isfile(path):
+			with open(path, "rb") as f:
+				digest.update(f.read())
+	return digest.hexdigest()[:12]
+
+
+BUILD_ID = _build_id()
+
+
+def current_month():
+	"""当前月份：(月份键, 本月开始的时间戳)"""
+	now = datetime.now()
+	start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+	return now.strftime("%Y-%m"), start.timestamp()
+
+
+def conditional_get(scopes, period=None):
+	"""条件GET：根据 change_stamps 中的版本生成强 ETag，未变化时在渲染模板前返回304
+
+	scopes 为返回作用域列表的函数（在请求上下文中调用）；版本号同时放入 g.view_version，
+	视图把它作为 view_cache 键的一部分，其他进程写入后不会读到旧缓存。
+	内容还随时间段变化的页面（如按当前月份显示）传入 period（如 current_month），
+	返回的键放入 g.period 并参与 ETag，Last-Modified 不早于该时间段的开始，跨月后不会再返回304。
+	有待显示的 flash 消息时正常渲染且不带 ETag，避免浏览器缓存一次性消息。
+	"""
+	def decorator(view_func):
+		@wraps(view_func)
+		def wrapped(*args, **kwargs):
+			g.period, period_start = period() if period else (None, None)
+			if request.method != "GET" or session.get("_flashes"):
+				g.view_version = None
+				return view_func(*args, **kwargs)
+			versions, last_modified = change_stamps.read(scopes())
+			g.view_version = tuple(sorted(versions.items()))
+			key = repr((BUILD_ID, request.endpoint, session.get("user_id"), session.get("role"),
+						request.query_string, g.view_version, g.period))
+			etag = hashlib.sha1(key.encode("utf-8")).hexdigest()
+			if period_start:
+				last_modified = max(last_modified or 0, period_start)
+			last_modified = datetime.fromtimestamp(last_modified, timezone.utc) if last_modified else None
+
+			if request.if_none_match:
+				# 压缩中间件会把 ETag 改成弱 ETag，这里按弱比较
+				not_modified = request.if_none_match.contains_weak(etag)
+			else:
+				not_modified = bool(last_modified and request.if_modified_since and last_modified <= request.if_modified_since)
+			if not_modified:
+				response = make_response("", 304)
+			else:
+				response = make_response(view_func(*args, **kwargs))
+				if response.status_code != 200:
+					return response
+			response.set_etag(etag)
+			if last_modified:
+				response.last_modified = last_modified
+			# 每次都向服务器验证；页面内容与登录用户相关
+			response.cache_control.private = True
+			response.cache_control.no_cache = True
+			response.vary.add("Cookie")
+			return response
+		return wrapped
+	return decorator
+
+
+def author_scope():
+	return [change_stamps.user_scope(session.get("user_id"))]
+
+
+@app.context_processor
+def inject_unread_count():
+	"""作者页面顶栏的未读通知角标（读取计数缓存，不查询 notifications 表）
+
+	带 ETag 的页面按 g.view_version 取缓存，未读数变化时版本也会变化，角标与 ETag 保持一致。
+	"""
+	if session.get("role") != "author" or not session.get("user_id"):
+		return {}
+	try:
+		return {"unread_count": notifications.unread_count(session.get("user_id"), g.get("view_version"))}
+	except Exception as e:
+		app.logger.warning(f"Unread count error: {e}")
+		return {}
+
+
 @app.route("/")
 def index():
 	try:
@@ -108,26 +303,38 @@ def login():
 	if request.method == "POST":
 		username = request.form.get("username", "").strip()
 		password = request.form.get("password", "")
+		# 先按IP和用户名限流，被限流的请求不查询数据库也不做密码校验
+		ip = ratelimit.client_ip(request)
+		wait = ratelimit.retry_after(ratelimit.LOGIN_IP, ip) or ratelimit.retry_after(ratelimit.LOGIN_USER, username.lower())
+		if wait:
+			flash(f"尝试次数过多，请 {wait} 秒后再试", "error")
+			return render_template("login.html"), 429, {"Retry-After": str(wait)}
+		ratelimit.hit(ratelimit.LOGIN_IP, ip)
 		try:
 			with get_db() as conn:
 				if conn is None:
 					flash("数据库连接失败", "error")
 					return render_template("login.html")
 				
-				# 使用兼容的查询函数
-				if POSTGRES_AVAILABLE and IS_VERCEL:
-					row = execute_query(conn, "SELECT id, username, password_hash, role FROM users WHERE username = %s", (username,))
-				else:
-					row = execute_query(conn, "SELECT id, username, password_hash, role FROM users WHERE username=?", (username,))
+				row = execute_query(conn, adapt_query("SELECT id, username, password_hash, role FROM users WHERE username=?"), (username,))
 				
-				if row and check_password_hash(row[2], password):
+				if row and passwords.verify_password(row[2], password):
+					# 哈希参数与当前策略不同时重新生成（条件中带旧哈希，避免覆盖并发修改）
+					if passwords.needs_rehash(row[2]):
+						execute_update(conn, adapt_query("UPDATE users SET password_hash=? WHERE id=? AND password_hash=?"),
+									   (passwords.hash_password(password), row[0], row[2]))
 					session["user_id"] = row[0]
 					session["username"] = row[1]
 					session["role"] = row[3]
+					ratelimit.reset(ratelimit.LOGIN_USER, username.lower())
 					flash("登录成功", "success")
 					return redirect(url_for("index"))
 				else:
+					ratelimit.hit(ratelimit.LOGIN_USER, username.lower())
 					flash("用户名或密码错误", "error")
+		except passwords.PasswordCheckBusy:
+			app.logger.warning("Login rejected: password check queue is full")
+			flash("登录人数较多，请稍后再试", "error")
 		except Exception as e:
 			app.logger.error(f"Login error: {e}")
 			flash("登录时发生错误，请稍后再试", "error")
@@ -157,26 +364,17 @@ def register():
 				return render_template("register.html")
 			
 			# 检查用户名是否已存在
-			if POSTGRES_AVAILABLE and IS_VERCEL:
-				exists = execute_query(conn, "SELECT 1 FROM users WHERE username = %s", (username,))
-			else:
-				exists = execute_query(conn, "SELECT 1 FROM users WHERE username=?", (username,))
+			exists = execute_query(conn, adapt_query("SELECT 1 FROM users WHERE username=?"), (username,))
 			
 			if exists:
 				flash("用户名已存在", "error")
 				return render_template("register.html")
 			
 			# 创建作者用户
-			if POSTGRES_AVAILABLE and IS_VERCEL:
-				execute_update(conn, 
-					"INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s)",
-					(username, generate_password_hash(password), "author")
-				)
-			else:
-				execute_update(conn,
-					"INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-					(username, generate_password_hash(password), "author")
-				)
+			execute_update(conn,
+				adapt_query("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)"),
+				(username, passwords.hash_password(password), "author")
+			)
 			
 			flash("注册成功，请登录", "success")
 			return redirect(url_for("login"))
@@ -192,34 +390,78 @@ def author_dashboard():
 
 @app.route("/author/contracts")
 @login_required(role="author")
+@conditional_get(author_scope, period=current_month)
 def author_contracts():
 	user_id = session.get("user_id")
-	month_key = datetime.now().strftime("%Y-%m")
+	month_key = g.period
+	# 历史记录按月份倒序翻页（不含当前月份，已录入的未来月份也显示）；history_before 为上一页最早的月份
+	history_before = request.args.get("history_before")
+	try:
+		datetime.strptime(history_before or "", "%Y-%m")
+	except ValueError:
+		history_before = None
+	data = view_cache.get_or_load(
+		"author_contracts", user_id, (month_key, history_before, g.view_version),
+		lambda: load_author_contracts(user_id, month_key, history_before),
+	)
+	return render_template(
+		"author_contracts.html",
+		month=month_key,
+		history_paged=history_before is not None,
+		**data,
+	)
+
+
+# 我的签约页每页显示的历史月份数
+HISTORY_MONTHS_PER_PAGE = 12
+
+
+def load_author_contracts(user_id, month_key, history_before):
 	with get_db() as conn:
-		books = conn.execute(
-			"SELECT id, title, contract_type, buyout_amount FROM books WHERE author_id=? ORDER BY id DESC",
+		books = execute_query_all(conn,
+			adapt_query("SELECT id, title, contract_type, buyout_amount FROM books WHERE author_id=? ORDER BY id DESC"),
 			(user_id,),
-		).fetchall()
-		royalties_curr = conn.execute(
-			"SELECT book_id, amount FROM royalties WHERE author_id=? AND month=? AND book_id IS NOT NULL",
+		)
+		royalties_curr = execute_query_all(conn,
+			adapt_query("SELECT book_id, amount FROM royalties WHERE author_id=? AND month=? AND book_id IS NOT NULL"),
 			(user_id, month_key),
-		).fetchall()
+		)
 		curr_map = {r[0]: r[1] for r in royalties_curr}
-		history_rows = conn.execute(
-			"SELECT book_id, month, amount FROM royalties WHERE author_id=? AND book_id IS NOT NULL AND month<>? ORDER BY month DESC",
-			(user_id, month_key),
-		).fetchall()
+		# 本页的历史月份读取预先汇总的表，多取一行判断是否还有更早的月份
+		conditions = "author_id=? AND month<>?"
+		params = [user_id, month_key]
+		if history_before:
+			conditions += " AND month<?"
+			params.append(history_before)
+		month_totals = execute_query_all(conn,
+			adapt_query(f"SELECT month, total, books FROM royalty_author_months WHERE {conditions} ORDER BY month DESC LIMIT {HISTORY_MONTHS_PER_PAGE + 1}"),
+			params,
+		)
+		has_more = len(month_totals) > HISTORY_MONTHS_PER_PAGE
+		month_totals = month_totals[:HISTORY_MONTHS_PER_PAGE]
+		# 每本书的明细只取本页月份范围内的稿费
 		history = {}
-		for r in history_rows:
-			book_id, m, amt = r
-			history.setdefault(book_id, []).append((m, amt))
-	return render_template(
-		"author_contracts.html",
-		books=books,
-		month=month_key,
-		bookIdToRoyalty=curr_map,
-		history=history,
-	)
+		if month_totals:
+			for book_id, m, amt in execute_query_all(conn,
+				adapt_query("SELECT book_id, month, amount FROM royalties WHERE author_id=? AND month<>? AND month<=? AND month>=? AND book_id IS NOT NULL ORDER BY month DESC"),
+				(user_id, month_key, month_totals[0][0], month_totals[-1][0]),
+			):
+				history.setdefault(book_id, []).append((m, amt))
+		book_totals = {
+			r[0]: (r[1], r[2], r[3])
+			for r in execute_query_all(conn,
+				adapt_query("SELECT book_id, total, months, last_month FROM royalty_book_totals WHERE author_id=?"),
+				(user_id,),
+			)
+		}
+	return {
+		"books": books,
+		"bookIdToRoyalty": curr_map,
+		"month_totals": month_totals,
+		"history": history,
+		"history_next": month_totals[-1][0] if has_more else None,
+		"book_totals": book_totals,
+	}
 
 
 @app.route("/author/apply", methods=["GET", "POST"])
@@ -232,12 +474,13 @@ def author_apply():
 		if not title or not pen_name or contract_type not in ("保底", "买断"):
 			flash("请完整填写申请信息并选择正确签约方式", "error")
 			return redirect(url_for("author_apply"))
-		with get_db() as conn:
-			conn.execute(
-				"INSERT INTO applications (author_id, title, pen_name, contract_type) VALUES (?, ?, ?, ?)",
+		with get_db() as conn, transaction(conn):
+			execute_update(conn,
+				adapt_query("INSERT INTO applications (author_id, title, pen_name, contract_type) VALUES (?, ?, ?, ?)"),
 				(session.get("user_id"), title, pen_name, contract_type),
 			)
-			conn.commit()
+			change_stamps.bump(conn, author_scope())
+		view_cache.invalidate_user([session.get("user_id")], {"author_results"})
 		flash("申请已提交，等待审核", "success")
 		return redirect(url_for("author_results"))
 	return render_template("author_apply.html")
@@ -245,37 +488,69 @@ def author_apply():
 
 @app.route("/author/results")
 @login_required(role="author")
+@conditional_get(author_scope)
 def author_results():
 	user_id = session.get("user_id")
-	with get_db() as conn:
-		applications = conn.execute(
-			"SELECT id, title, pen_name, contract_type, status, reject_reason, created_at FROM applications WHERE author_id=? ORDER BY id DESC",
-			(user_id,),
-		).fetchall()
+
+	def load():
+		with get_db() as conn:
+			return execute_query_all(conn,
+				adapt_query("SELECT id, title, pen_name, contract_type, status, reject_reason, created_at FROM applications WHERE author_id=? ORDER BY id DESC"),
+				(user_id,),
+			)
+
+	applications = view_cache.get_or_load("author_results", user_id, g.view_version, load)
 	return render_template("author_results.html", applications=applications)
 
 
 @app.route("/author/notifications")
 @login_required(role="author")
+@conditional_get(author_scope)
 def author_notifications():
 	user_id = session.get("user_id")
-	with get_db() as conn:
-		notifications = conn.execute(
-			"SELECT id, message, created_at, is_read FROM notifications WHERE recipient_id=? ORDER BY id DESC",
-			(user_id,),
-		).fetchall()
-	return render_template("author_notifications.html", notifications=notifications)
+
+	def load():
+		with get_db() as conn:
+			return fetch_keyset_page(conn,
+				"SELECT id, message, created_at, is_read FROM notifications",
+				"id", "recipient_id=?", (user_id,),
+			)
+
+	page = view_cache.get_or_load("author_notifications", user_id, (get_page_args(), g.view_version), load)
+	return render_template("author_notifications.html", notifications=page["rows"], page=page)
+
+
+# 新通知实时推送（SSE）；浏览器断线重连时带 Last-Event-ID，补发断开期间的通知
+@app.route("/author/notifications/stream")
+@login_required(role="author")
+def author_notification_stream():
+	user_id = session.get("user_id")
+	last_id = request.headers.get("Last-Event-ID", type=int)
+	subscriber = notification_stream.hub.subscribe(user_id, last_id)
+	if subscriber is None:
+		return Response("too many connections", status=503, headers={"Retry-After": "30"})
+	try:
+		missed = notification_stream.backfill(user_id, last_id) if last_id is not None else []
+	except Exception:
+		notification_stream.hub.unsubscribe(subscriber)
+		raise
+	response = Response(
+		notification_stream.stream(subscriber, missed),
+		content_type="text/event-stream; charset=utf-8",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+	# 响应还没开始发送客户端就断开时，生成器不会执行 finally
+	response.call_on_close(lambda: notification_stream.hub.unsubscribe(subscriber))
+	return response
 
 
 @app.route("/author/notifications/read", methods=["POST"])
 @login_required(role="author")
 def author_mark_notifications_read():
-	with get_db() as conn:
-		conn.execute(
-			"UPDATE notifications SET is_read=1 WHERE recipient_id=?",
-			(session.get("user_id"),),
-		)
-		conn.commit()
+	with get_db() as conn, transaction(conn):
+		notifications.mark_all_read(conn, session.get("user_id"))
+		change_stamps.bump(conn, author_scope())
+	view_cache.invalidate_user([session.get("user_id")], {"author_notifications"})
 	return redirect(url_for("author_notifications"))
 
 
@@ -283,9 +558,10 @@ def author_mark_notifications_read():
 @login_required(role="author")
 def author_mark_notification_one():
 	nid = request.form.get("id")
-	with get_db() as conn:
-		conn.execute("UPDATE notifications SET is_read=1 WHERE id=? AND recipient_id=?", (nid, session.get("user_id")))
-		conn.commit()
+	with get_db() as conn, transaction(conn):
+		notifications.mark_one_read(conn, session.get("user_id"), nid)
+		change_stamps.bump(conn, author_scope())
+	view_cache.invalidate_user([session.get("user_id")], {"author_notifications"})
 	return redirect(url_for("author_notifications"))
 
 
@@ -294,134 +570,165 @@ def author_mark_notification_one():
 @login_required(role="admin")
 def admin_delete_book():
 	book_id = request.form.get("book_id")
-	with get_db() as conn:
-		conn.execute("DELETE FROM books WHERE id=?", (book_id,))
-		conn.execute("DELETE FROM royalties WHERE book_id=?", (book_id,))
-		conn.commit()
+	with get_db() as conn, transaction(conn):
+		author = execute_query(conn, adapt_query("SELECT author_id FROM books WHERE id=?"), (book_id,))
+		keys = execute_query_all(conn, adapt_query("SELECT author_id, book_id, month FROM royalties WHERE book_id=?"), (book_id,))
+		execute_batch(conn, [
+			(adapt_query("DELETE FROM books WHERE id=?"), (book_id,)),
+			(adapt_query("DELETE FROM royalties WHERE book_id=?"), (book_id,)),
+		] + royalty_rollups.refresh_statements(keys)
+		  + change_stamps.bump_statements(["books"] + ([change_stamps.user_scope(author[0])] if author else [])))
 		flash("已删除书籍及稿费记录", "success")
+	if author:
+		view_cache.invalidate_user([author[0]])
 	return redirect(url_for("admin_books"))
 
 
 @app.route("/admin/apps", methods=["GET", "POST"])
 @login_required(role="admin")
 def admin_apps():
+	if request.method == "POST":
+		admin_apps_action()
+		# 保留分页参数，处理完回到原来那一页
+		return redirect(url_for("admin_apps", **request.args))
 	with get_db() as conn:
-		if POSTGRES_AVAILABLE and IS_VERCEL:
-			apps = execute_query_all(conn, """
-				SELECT a.id, u.username, a.title, a.pen_name, a.contract_type, a.status, a.reject_reason, a.created_at, 
-					   r.username as reviewer_name
-				FROM applications a 
-				JOIN users u ON a.author_id=u.id 
-				LEFT JOIN users r ON a.reviewer_id=r.id 
-				ORDER BY a.id DESC
-			""")
+		page = fetch_keyset_page(conn, """
+			SELECT a.id, u.username, a.title, a.pen_name, a.contract_type, a.status, a.reject_reason, a.created_at, 
+				   r.username as reviewer_name
+			FROM applications a 
+			JOIN users u ON a.author_id=u.id 
+			LEFT JOIN users r ON a.reviewer_id=r.id
+		""", "a.id")
+	return render_template("admin_apps.html", apps=page["rows"], page=page)
+
+
+def admin_apps_action():
+	"""处理审核操作（同意/拒绝）
+
+	只读取待处理的那一条申请，状态更新、建书和通知在同一个事务中完成、只提交一次；
+	UPDATE 带 status='pending' 条件，两个管理员同时处理同一申请时只有一个会成功。
+	"""
+	action = request.form.get("action")
+	if action in ("bulk_approve", "bulk_reject"):
+		return admin_apps_bulk_action(action)
+	app_id = request.form.get("app_id")
+	if action not in ("approve_app", "reject_app") or not app_id:
+		return
+	# 获取当前管理员ID
+	current_admin_id = session.get('user_id')
+	with get_db() as conn, transaction(conn):
+		row = execute_query(conn, adapt_query("SELECT author_id, title, pen_name, contract_type FROM applications WHERE id=? AND status='pending'"), (app_id,))
+		if not row:
+			flash("申请不存在或已被处理", "error")
+			return
+		author_id, title, pen_name, contract_type = row
+
+		if action == "approve_app":
+			buyout_amount = request.form.get("buyout_amount")
+			if contract_type == '买断' and not buyout_amount:
+				flash("买断需要填写买断稿费", "error")
+				return
+			updated = execute_update(conn, adapt_query("UPDATE applications SET status='approved', processed_at=CURRENT_TIMESTAMP, reviewer_id=? WHERE id=? AND status='pending'"), (current_admin_id, app_id))
+			if updated != 1:
+				flash("申请已被其他管理员处理", "error")
+				return
+			if contract_type == '买断':
+				book = (adapt_query("INSERT INTO books (title, author_id, pen_name, contract_type, buyout_amount) VALUES (?, ?, ?, '买断', ?)"), (title, author_id, pen_name, buyout_amount))
+			else:
+				book = (adapt_query("INSERT INTO books (title, author_id, pen_name, contract_type) VALUES (?, ?, ?, '保底')"), (title, author_id, pen_name))
+			# 建书与通知事件合并为一次往返，通知由 outbox 分发器写入
+			event = ("application_approved", author_id, {"title": title, "contract_type": contract_type, "buyout_amount": buyout_amount})
+			execute_batch(conn, [book] + outbox.statements([event])
+						  + change_stamps.bump_statements(["books", change_stamps.user_scope(author_id)]))
+			flash("已同意买断并通知作者" if contract_type == '买断' else "已同意保底并通知作者", "success")
 		else:
-			apps = execute_query_all(conn, """
-				SELECT a.id, u.username, a.title, a.pen_name, a.contract_type, a.status, a.reject_reason, a.created_at, 
-					   r.username as reviewer_name
-				FROM applications a 
-				JOIN users u ON a.author_id=u.id 
-				LEFT JOIN users r ON a.reviewer_id=r.id 
-				ORDER BY a.id DESC
-			""")
-	if request.method == "POST":
-		action = request.form.get("action")
-		with get_db() as conn:
-			if action == "approve_app":
-				app_id = request.form.get("app_id")
-				buyout_amount = request.form.get("buyout_amount")
-				if app_id:
-					if POSTGRES_AVAILABLE and IS_VERCEL:
-						row = execute_query(conn, "SELECT author_id, title, pen_name, contract_type FROM applications WHERE id = %s", (app_id,))
-					else:
-						row = execute_query(conn, "SELECT author_id, title, pen_name, contract_type FROM applications WHERE id=?", (app_id,))
-					if row:
-						# 获取当前管理员ID
-						current_admin_id = session.get('user_id')
-						if row[3] == '买断':
-							if not buyout_amount:
-								flash("买断需要填写买断稿费", "error")
-								return redirect(url_for("admin_apps"))
-							if POSTGRES_AVAILABLE and IS_VERCEL:
-								execute_update(conn, "UPDATE applications SET status='approved', processed_at=NOW(), reviewer_id=%s WHERE id=%s", (current_admin_id, app_id))
-								execute_update(conn,
-									"INSERT INTO books (title, author_id, pen_name, contract_type, buyout_amount) VALUES (%s, %s, %s, '买断', %s)",
-									(row[1], row[0], row[2], buyout_amount),
-								)
-								execute_update(conn,
-									"INSERT INTO notifications (recipient_id, message) VALUES (%s, %s)",
-									(row[0], f"您的签约申请已通过（买断），《{row[1]}》买断稿费：¥{buyout_amount}"),
-								)
-							else:
-								execute_update(conn, "UPDATE applications SET status='approved', processed_at=datetime('now'), reviewer_id=? WHERE id=?", (current_admin_id, app_id))
-								execute_update(conn,
-									"INSERT INTO books (title, author_id, pen_name, contract_type, buyout_amount) VALUES (?, ?, ?, '买断', ?)",
-									(row[1], row[0], row[2], buyout_amount),
-								)
-								execute_update(conn,
-									"INSERT INTO notifications (recipient_id, message) VALUES (?, ?)",
-									(row[0], f"您的签约申请已通过（买断），《{row[1]}》买断稿费：¥{buyout_amount}"),
-								)
-							flash("已同意买断并通知作者", "success")
-						else:
-							if POSTGRES_AVAILABLE and IS_VERCEL:
-								execute_update(conn, "UPDATE applications SET status='approved', processed_at=NOW(), reviewer_id=%s WHERE id=%s", (current_admin_id, app_id))
-								execute_update(conn,
-									"INSERT INTO books (title, author_id, pen_name, contract_type) VALUES (%s, %s, %s, '保底')",
-									(row[1], row[0], row[2]),
-								)
-								execute_update(conn,
-									"INSERT INTO notifications (recipient_id, message) VALUES (%s, %s)",
-									(row[0], f"您的签约申请已通过（保底），《{row[1]}》后续按月设置稿费"),
-								)
-							else:
-								execute_update(conn, "UPDATE applications SET status='approved', processed_at=datetime('now'), reviewer_id=? WHERE id=?", (current_admin_id, app_id))
-								execute_update(conn,
-									"INSERT INTO books (title, author_id, pen_name, contract_type) VALUES (?, ?, ?, '保底')",
-									(row[1], row[0], row[2]),
-								)
-								execute_update(conn,
-									"INSERT INTO notifications (recipient_id, message) VALUES (?, ?)",
-									(row[0], f"您的签约申请已通过（保底），《{row[1]}》后续按月设置稿费"),
-								)
-							flash("已同意保底并通知作者", "success")
-			elif action == "reject_app":
-				app_id = request.form.get("app_id")
+			reason = request.form.get("reason", "").strip() or "未提供原因"
+			updated = execute_update(conn, adapt_query("UPDATE applications SET status='rejected', reject_reason=?, processed_at=CURRENT_TIMESTAMP, reviewer_id=? WHERE id=? AND status='pending'"), (reason, current_admin_id, app_id))
+			if updated != 1:
+				flash("申请已被其他管理员处理", "error")
+				return
+			execute_batch(conn, outbox.statements([("application_rejected", author_id, {"title": title, "reason": reason})])
+						  + change_stamps.bump_statements([change_stamps.user_scope(author_id)]))
+			flash("已拒绝并通知作者", "success")
+	view_cache.invalidate_user([author_id])
+	outbox.kick()
+
+
+# 一次批量审核最多处理的申请数
+MAX_BULK_APPS = 500
+
+def admin_apps_bulk_action(action):
+	"""批量同意（仅保底）或批量拒绝（共用一个原因）
+
+	先锁定仍处于待处理状态的申请，再用基于集合的 INSERT ... SELECT / UPDATE ... WHERE id IN (...)
+	在一个事务中建书、写通知事件、更新状态；买断申请需要逐条填写金额，批量同意时跳过。
+	"""
+	app_ids = []
+	for raw in request.form.getlist("app_ids"):
+		try:
+			app_ids.append(int(raw))
+		except ValueError:
+			continue
+	app_ids = sorted(set(app_ids))
+	if not app_ids:
+		flash("请选择要处理的申请", "error")
+		return
+	if len(app_ids) > MAX_BULK_APPS:
+		flash(f"一次最多处理 {MAX_BULK_APPS} 条申请", "error")
+		return
+
+	current_admin_id = session.get('user_id')
+	ids_sql, ids_params = in_clause("id", app_ids)
+	condition = f"{ids_sql} AND status='pending'"
+	if action == "bulk_approve":
+		condition += " AND contract_type='保底'"
+	# PostgreSQL 下加行锁，防止与其他管理员的单条审核交错导致重复建书
+	lock = " FOR UPDATE" if POSTGRES_AVAILABLE and IS_VERCEL else ""
+
+	with get_db() as conn, transaction(conn):
+		rows = execute_query_all(conn, adapt_query(f"SELECT id, author_id, title FROM applications WHERE {condition}{lock}"), ids_params)
+		locked_ids = [r[0] for r in rows]
+		if locked_ids:
+			locked_sql, locked_params = in_clause("id", locked_ids)
+			if action == "bulk_approve":
+				events = [("application_approved", r[1], {"title": r[2], "contract_type": "保底", "buyout_amount": None}) for r in rows]
+				statements = [
+					(adapt_query(f"""
+						INSERT INTO books (title, author_id, pen_name, contract_type)
+						SELECT title, author_id, pen_name, '保底' FROM applications WHERE {locked_sql} ORDER BY id
+					"""), locked_params),
+					(adapt_query(f"UPDATE applications SET status='approved', processed_at=CURRENT_TIMESTAMP, reviewer_id=? WHERE {locked_sql}"),
+						[current_admin_id] + locked_params),
+				]
+			else:
 				reason = request.form.get("reason", "").strip() or "未提供原因"
-				if app_id:
-					if POSTGRES_AVAILABLE and IS_VERCEL:
-						row = execute_query(conn, "SELECT author_id, title FROM applications WHERE id = %s", (app_id,))
-					else:
-						row = execute_query(conn, "SELECT author_id, title FROM applications WHERE id=?", (app_id,))
-					# 获取当前管理员ID
-					current_admin_id = session.get('user_id')
-					if POSTGRES_AVAILABLE and IS_VERCEL:
-						execute_update(conn, "UPDATE applications SET status='rejected', reject_reason=%s, processed_at=NOW(), reviewer_id=%s WHERE id=%s", (reason, current_admin_id, app_id))
-						if row:
-							execute_update(conn,
-								"INSERT INTO notifications (recipient_id, message) VALUES (%s, %s)",
-								(row[0], f"您的签约申请被拒绝：《{row[1]}》，原因：{reason}"),
-							)
-					else:
-						execute_update(conn, "UPDATE applications SET status='rejected', reject_reason=?, processed_at=datetime('now'), reviewer_id=? WHERE id=?", (reason, current_admin_id, app_id))
-						if row:
-							execute_update(conn,
-								"INSERT INTO notifications (recipient_id, message) VALUES (?, ?)",
-								(row[0], f"您的签约申请被拒绝：《{row[1]}》，原因：{reason}"),
-							)
-					flash("已拒绝并通知作者", "success")
-		return redirect(url_for("admin_apps"))
-	return render_template("admin_apps.html", apps=apps)
+				events = [("application_rejected", r[1], {"title": r[2], "reason": reason}) for r in rows]
+				statements = [
+					(adapt_query(f"UPDATE applications SET status='rejected', reject_reason=?, processed_at=CURRENT_TIMESTAMP, reviewer_id=? WHERE {locked_sql}"),
+						[reason, current_admin_id] + locked_params),
+				]
+			scopes = [change_stamps.user_scope(r[1]) for r in rows]
+			if action == "bulk_approve":
+				scopes.append("books")
+			execute_batch(conn, statements + outbox.statements(events) + change_stamps.bump_statements(scopes))
+	view_cache.invalidate_user({r[1] for r in rows})
+	if rows:
+		outbox.kick()
+
+	processed = len(locked_ids)
+	skipped = len(app_ids) - processed
+	verb = "同意" if action == "bulk_approve" else "拒绝"
+	message = f"已批量{verb} {processed} 条申请并通知作者"
+	if skipped:
+		message += f"，跳过 {skipped} 条（已处理" + ("或买断申请）" if action == "bulk_approve" else "）")
+	flash(message, "success" if processed else "info")
+	return {"processed": processed, "skipped": skipped}
 
 
 @app.route("/admin/royalties", methods=["GET", "POST"])
 @login_required(role="admin")
 def admin_royalties():
 	month_key = request.args.get("month") or datetime.now().strftime("%Y-%m")
-	with get_db() as conn:
-		books = conn.execute(
-			"SELECT b.id, b.title, u.username, b.contract_type FROM books b JOIN users u ON b.author_id=u.id ORDER BY u.username ASC, b.id DESC"
-		).fetchall()
 	if request.method == "POST":
 		book_id_raw = request.form.get("book_id")
 		amount_raw = request.form.get("amount")
@@ -443,35 +750,120 @@ def admin_royalties():
 			return redirect(url_for("admin_royalties", month=month_key))
 		try:
 			with get_db() as conn:
-				row = conn.execute("SELECT author_id, title, contract_type FROM books WHERE id=?", (book_id,)).fetchone()
+				row = execute_query(conn, adapt_query("SELECT author_id, title, contract_type FROM books WHERE id=?"), (book_id,))
 				if not row:
 					flash("书籍不存在", "error")
 					return redirect(url_for("admin_royalties", month=month))
 				if row[2] != '保底':
 					flash("仅保底合同需要设置月度稿费", "error")
 					return redirect(url_for("admin_royalties", month=month))
-				exists = conn.execute("SELECT 1 FROM royalties WHERE book_id=? AND month=?", (book_id, month)).fetchone()
-				if exists:
-					conn.execute("UPDATE royalties SET amount=? WHERE book_id=? AND month=?", (amount, book_id, month))
-				else:
-					conn.execute("INSERT INTO royalties (author_id, month, amount, book_id) VALUES (?, ?, ?, ?)", (row[0], month, amount, book_id))
-				conn.execute("INSERT INTO notifications (recipient_id, message) VALUES (?, ?)", (row[0], f"已设置《{row[1]}》 {month} 稿费：¥{amount:.2f}"))
-				conn.commit()
+				# 依赖 royalties(book_id, month) 唯一索引：同一本书同一月份只会有一条记录
+				with transaction(conn):
+					execute_batch(conn, [
+						(adapt_query("""
+							INSERT INTO royalties (author_id, month, amount, book_id) VALUES (?, ?, ?, ?)
+							ON CONFLICT (book_id, month) DO UPDATE SET amount = excluded.amount
+						"""), (row[0], month, amount, book_id)),
+					] + royalty_rollups.refresh_statements([(row[0], book_id, month)])
+					  + outbox.statements([("royalty_set", row[0], {"title": row[1], "month": month, "amount": amount})])
+					  + change_stamps.bump_statements([change_stamps.user_scope(row[0])]))
+				view_cache.invalidate_user([row[0]])
+				outbox.kick()
 				flash("已设置书籍月度稿费并通知作者", "success")
 		except Exception as e:
 			flash(f"设置失败：{e}", "error")
 		return redirect(url_for("admin_royalties", month=month))
+	with get_db() as conn:
+		books = execute_query_all(conn,
+			"SELECT b.id, b.title, u.username, b.contract_type FROM books b JOIN users u ON b.author_id=u.id ORDER BY u.username ASC, b.id DESC"
+		)
 	return render_template("admin_royalties.html", books=books, month=month_key)
 
 
+@app.route("/admin/royalties/import", methods=["POST"])
+@login_required(role="admin")
+def admin_royalties_import():
+	"""批量导入某月保底稿费：上传CSV文件，或POST JSON；JSON请求返回逐行结果"""
+	wants_json = request.is_json or request.args.get("format") == "json"
+	month = (request.get_json(silent=True) or {}).get("month") if request.is_json else request.form.get("month")
+	month = month or request.args.get("month") or datetime.now().strftime("%Y-%m")
+	skip_invalid = request.form.get("skip_invalid") == "1" or request.args.get("skip_invalid") == "1"
+	try:
+		if request.is_json:
+			rows = royalty_import.parse_json(request.get_json())
+		else:
+			upload = request.files.get("file")
+			if not upload or not upload.filename:
+				raise royalty_import.RoyaltyImportError("请选择要上传的CSV文件")
+			rows = royalty_import.parse_csv(upload.read())
+		with get_db() as conn:
+			report = royalty_import.import_rows(conn, rows, month, skip_invalid=skip_invalid)
+	except royalty_import.RoyaltyImportError as e:
+		if wants_json:
+			return {"error": str(e)}, 400
+		flash(str(e), "error")
+		return redirect(url_for("admin_royalties", month=month))
+	except Exception as e:
+		app.logger.error(f"Royalty import error: {e}")
+		if wants_json:
+			return {"error": f"导入失败：{e}"}, 500
+		flash(f"导入失败：{e}", "error")
+		return redirect(url_for("admin_royalties", month=month))
+
+	if wants_json:
+		return report, 200 if report["imported"] or not report["failed"] else 422
+	if report["imported"]:
+		flash(f"已导入 {report['imported']} 条稿费并通知作者", "success")
+	if report["failed"]:
+		flash(f"{report['failed']} 行校验失败" + ("，已跳过" if report["imported"] else "，未导入任何数据"), "error")
+	with get_db() as conn:
+		books = execute_query_all(conn,
+			"SELECT b.id, b.title, u.username, b.contract_type FROM books b JOIN users u ON b.author_id=u.id ORDER BY u.username ASC, b.id DESC"
+		)
+	errors = [r for r in report["rows"] if r["status"] == "error"]
+	return render_template("admin_royalties.html", books=books, month=month, import_report=report, import_errors=errors)
+
+
+@app.route("/admin/royalties/report")
+@login_required(role="admin")
+def admin_royalty_report():
+	"""按月份汇总的稿费报表，直接读取 royalty_month_totals"""
+	with get_db() as conn:
+		months = execute_query_all(conn, "SELECT month, total, books, authors FROM royalty_month_totals ORDER BY month DESC")
+	return render_template("admin_royalty_report.html", months=months)
+
+
+@app.route("/admin/export/<name>.<fmt>")
+@login_required(role="admin")
+def admin_export(name, fmt):
+	"""流式导出 books / royalties / applications 为 CSV 或 NDJSON；筛选参数见 exports.EXPORTS"""
+	if name not in exports.EXPORTS or fmt not in exports.FORMATS:
+		abort(404)
+	filename = f"{name}-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+	return Response(
+		exports.stream(name, fmt, request.args),
+		content_type=exports.FORMATS[fmt],
+		headers={
+			"Content-Disposition": f'attachment; filename="{filename}"',
+			"Cache-Control": "no-store",
+			# 让反向代理不要缓冲整个响应
+			"X-Accel-Buffering": "no",
+		},
+	)
+
+
 @app.route("/admin/books")
 @login_required(role="admin")
+@conditional_get(lambda: ["books"])
 def admin_books():
 	with get_db() as conn:
-		books = execute_query_all(conn,
-			"SELECT b.id, b.title, u.username, b.contract_type, b.buyout_amount, b.created_at FROM books b JOIN users u ON b.author_id=u.id ORDER BY u.username ASC, b.id DESC"
+		# 与原来一样按作者用户名排列，同一作者的书按id倒序
+		page = fetch_keyset_page(conn,
+			"SELECT b.id, b.title, u.username, b.contract_type, b.buyout_amount, b.created_at FROM books b JOIN users u ON b.author_id=u.id",
+			"b.id",
+			sort=("u.username", 2),
 		)
-	return render_template("admin_books.html", books=books)
+	return render_template("admin_books.html", books=page["rows"], page=page)
 
 
 @app.route("/admin")
@@ -487,14 +879,9 @@ def admin_users():
 			flash("数据库连接失败", "error")
 			return redirect(url_for("admin_apps"))
 		
-		if POSTGRES_AVAILABLE and IS_VERCEL:
-			with conn.cursor() as cur:
-				cur.execute("SELECT id, username, role, created_at FROM users ORDER BY id DESC")
-				users = cur.fetchall()
-		else:
-			users = conn.execute("SELECT id, username, role, created_at FROM users ORDER BY id DESC").fetchall()
+		page = fetch_keyset_page(conn, "SELECT id, username, role FROM users", "id")
 	
-	return render_template("admin_users.html", users=users)
+	return render_template("admin_users.html", users=page["rows"], page=page)
 
 @app.route("/admin/users/delete", methods=["POST"])
 @login_required(role="admin")
@@ -511,39 +898,20 @@ def admin_delete_user():
 			flash("数据库连接失败", "error")
 			return redirect(url_for("admin_users"))
 		
-		if POSTGRES_AVAILABLE and IS_VERCEL:
-			with conn.cursor() as cur:
-				# 检查用户是否存在且为管理员
-				cur.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-				user = cur.fetchone()
-				
-				if not user:
-					flash("用户不存在", "error")
-					return redirect(url_for("admin_users"))
-				
-				if user[0] != 'admin':
-					flash("只能删除管理员账号", "error")
-					return redirect(url_for("admin_users"))
-				
-				# 删除用户
-				cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
-				flash("用户删除成功", "success")
-		else:
-			# 检查用户是否存在且为管理员
-			user = conn.execute("SELECT role FROM users WHERE id = ?", (user_id,)).fetchone()
-			
-			if not user:
-				flash("用户不存在", "error")
-				return redirect(url_for("admin_users"))
-			
-			if user[0] != 'admin':
-				flash("只能删除管理员账号", "error")
-				return redirect(url_for("admin_users"))
-			
-			# 删除用户
-			conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
-			conn.commit()
-			flash("用户删除成功", "success")
+		# 检查用户是否存在且为管理员
+		user = execute_query(conn, adapt_query("SELECT role FROM users WHERE id = ?"), (user_id,))
+		
+		if not user:
+			flash("用户不存在", "error")
+			return redirect(url_for("admin_users"))
+		
+		if user[0] != 'admin':
+			flash("只能删除管理员账号", "error")
+			return redirect(url_for("admin_users"))
+		
+		# 删除用户
+		execute_update(conn, adapt_query("DELETE FROM users WHERE id = ?"), (user_id,))
+		flash("用户删除成功", "success")
 	
 	return redirect(url_for("admin_users"))
 
@@ -551,11 +919,17 @@ def admin_delete_user():
 @app.route("/admin/management", methods=["GET", "POST"])
 def admin_management():
 	if request.method == "POST":
+		ip = ratelimit.client_ip(request)
+		wait = ratelimit.retry_after(ratelimit.ADMIN_KEY_IP, ip)
+		if wait:
+			flash(f"密钥错误次数过多，请 {wait} 秒后再试", "error")
+			return render_template("admin_management.html", admins=[]), 429, {"Retry-After": str(wait)}
 		access_key = request.form.get("access_key", "").strip()
 		if access_key == "kaqia111":
 			session["admin_verified"] = True
 			flash("密钥验证成功", "success")
 		else:
+			ratelimit.hit(ratelimit.ADMIN_KEY_IP, ip)
 			flash("密钥错误", "error")
 	
 	# 获取所有管理员列表
@@ -563,12 +937,7 @@ def admin_management():
 	if session.get("admin_verified"):
 		with get_db() as conn:
 			if conn:
-				if POSTGRES_AVAILABLE and IS_VERCEL:
-					with conn.cursor() as cur:
-						cur.execute("SELECT id, username FROM users WHERE role = 'admin' ORDER BY id")
-						admins = cur.fetchall()
-				else:
-					admins = conn.execute("SELECT id, username FROM users WHERE role = 'admin' ORDER BY id").fetchall()
+				admins = execute_query_all(conn, "SELECT id, username FROM users WHERE role = 'admin' ORDER BY id")
 	
 	return render_template("admin_management.html", admins=admins)
 
@@ -592,30 +961,17 @@ def admin_register():
 			return redirect(url_for("admin_management"))
 		
 		# 检查用户名是否已存在
-		if POSTGRES_AVAILABLE and IS_VERCEL:
-			with conn.cursor() as cur:
-				cur.execute("SELECT 1 FROM users WHERE username = %s", (username,))
-				exists = cur.fetchone()
-		else:
-			exists = conn.execute("SELECT 1 FROM users WHERE username=?", (username,)).fetchone()
+		exists = execute_query(conn, adapt_query("SELECT 1 FROM users WHERE username=?"), (username,))
 		
 		if exists:
 			flash("用户名已存在", "error")
 			return redirect(url_for("admin_management"))
 		
 		# 创建管理员用户
-		if POSTGRES_AVAILABLE and IS_VERCEL:
-			with conn.cursor() as cur:
-				cur.execute(
-					"INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s)",
-					(username, generate_password_hash(password), "admin")
-				)
-		else:
-			conn.execute(
-				"INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-				(username, generate_password_hash(password), "admin")
-			)
-			conn.commit()
+		execute_update(conn,
+			adapt_query("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)"),
+			(username, passwords.hash_password(password), "admin")
+		)
 		
 		flash("管理员账号创建成功", "success")
 	
@@ -628,10 +984,17 @@ def admin_delete():
 		flash("需要先验证访问密钥", "error")
 		return redirect(url_for("admin_management"))
 	
+	ip = ratelimit.client_ip(request)
+	wait = ratelimit.retry_after(ratelimit.ADMIN_KEY_IP, ip)
+	if wait:
+		flash(f"密钥错误次数过多，请 {wait} 秒后再试", "error")
+		return redirect(url_for("admin_management"))
+	
 	delete_key = request.form.get("delete_key", "").strip()
 	admin_id = request.form.get("admin_id")
 	
 	if delete_key != "kaqia222":
+		ratelimit.hit(ratelimit.ADMIN_KEY_IP, ip)
 		flash("删除密钥错误", "error")
 		return redirect(url_for("admin_management"))
 	
@@ -645,29 +1008,15 @@ def admin_delete():
 			return redirect(url_for("admin_management"))
 		
 		# 检查管理员是否存在
-		if POSTGRES_AVAILABLE and IS_VERCEL:
-			with conn.cursor() as cur:
-				cur.execute("SELECT username FROM users WHERE id = %s AND role = 'admin'", (admin_id,))
-				admin = cur.fetchone()
-				
-				if not admin:
-					flash("管理员不存在", "error")
-					return redirect(url_for("admin_management"))
-				
-				# 删除管理员
-				cur.execute("DELETE FROM users WHERE id = %s", (admin_id,))
-				flash(f"管理员 {admin[0]} 删除成功", "success")
-		else:
-			admin = conn.execute("SELECT username FROM users WHERE id = ? AND role = 'admin'", (admin_id,)).fetchone()
-			
-			if not admin:
-				flash("管理员不存在", "error")
-				return redirect(url_for("admin_management"))
-			
-			# 删除管理员
-			conn.execute("DELETE FROM users WHERE id = ?", (admin_id,))
-			conn.commit()
-			flash(f"管理员 {admin[0]} 删除成功", "success")
+		admin = execute_query(conn, adapt_query("SELECT username FROM users WHERE id = ? AND role = 'admin'"), (admin_id,))
+		
+		if not admin:
+			flash("管理员不存在", "error")
+			return redirect(url_for("admin_management"))
+		
+		# 删除管理员
+		execute_update(conn, adapt_query("DELETE FROM users WHERE id = ?"), (admin_id,))
+		flash(f"管理员 {admin[0]} 删除成功", "success")
 	
 	return redirect(url_for("admin_management"))
 
@@ -680,9 +1029,26 @@ def admin_logout():
 
 
 # 静态文件路由 - 确保在Vercel上正确工作
-@app.route("/static/<path:filename>")
+@app.url_defaults
+def hashed_static_url(endpoint, values):
+	"""url_for('static', filename=...) 自动换成 build-assets 生成的带指纹路径"""
+	if endpoint == "static" and "filename" in values:
+		values["filename"] = assets.hashed_name(values["filename"])
+
+
+@app.route("/static/<path:filename>", endpoint="static")
 def static_files(filename):
-	return send_from_directory(app.static_folder, filename)
+	path, encoding = assets.pick_variant(filename, request.accept_encodings)
+	immutable = assets.is_immutable(filename)
+	max_age = assets.IMMUTABLE_MAX_AGE if immutable else assets.DEFAULT_MAX_AGE
+	response = send_from_directory(assets.STATIC_DIR, path, mimetype=assets.guess_mimetype(filename), max_age=max_age)
+	if encoding:
+		response.headers["Content-Encoding"] = encoding
+	if os.path.splitext(filename)[1].lower() in assets.COMPRESSIBLE:
+		response.vary.add("Accept-Encoding")
+	if immutable:
+		response.cache_control.immutable = True
+	return response
 
 # 静态文件测试路由
 @app.route("/test-static")
@@ -698,10 +1064,97 @@ def vercel_info():
 		"status": "ok"
 	}, 200
 
+def api_login_required(view_func):
+	"""JSON API 使用登录会话鉴权；未登录时返回 401 而不是跳转到登录页"""
+	@wraps(view_func)
+	def wrapped(*args, **kwargs):
+		if not session.get("user_id"):
+			return {"error": "login required"}, 401
+		return view_func(*args, **kwargs)
+	return wrapped
+
+
+@app.route("/api/v1/<resource>")
+@api_login_required
+def api_list(resource):
+	"""列表（游标分页）或按 ids 批量取回；fields 指定返回的字段，其余参数为筛选条件"""
+	try:
+		spec = api_v1.get_resource(resource)
+		fields = api_v1.parse_fields(spec, request.args.get("fields"))
+		ids = api_v1.parse_ids(request.args["ids"]) if "ids" in request.args else None
+		where, params = api_v1.conditions(spec, request.args, session.get("user_id"), session.get("role"))
+	except api_v1.ApiError as e:
+		return {"error": str(e)}, e.status
+	with get_db() as conn:
+		if ids is not None:
+			rows, missing = api_v1.fetch_ids(conn, spec, fields, where, params, ids)
+			return {"data": api_v1.serialize(spec, fields, rows), "missing": missing}
+		page = fetch_keyset_page(conn, api_v1.select_sql(spec, fields), spec["id"], where, params)
+	return {
+		"data": api_v1.serialize(spec, fields, page["rows"]),
+		"next": page["next"],
+		"prev": page["prev"],
+		"per_page": page["per_page"],
+	}
+
+
+@app.route("/api/v1/<resource>/<int:item_id>")
+@api_login_required
+def api_detail(resource, item_id):
+	try:
+		spec = api_v1.get_resource(resource)
+		fields = api_v1.parse_fields(spec, request.args.get("fields"))
+	except api_v1.ApiError as e:
+		return {"error": str(e)}, e.status
+	where, params = api_v1.conditions(spec, {}, session.get("user_id"), session.get("role"))
+	with get_db() as conn:
+		rows, _ = api_v1.fetch_ids(conn, spec, fields, where, params, [item_id])
+	if not rows:
+		return {"error": "not found"}, 404
+	return {"data": api_v1.serialize(spec, fields, rows)[0]}
+
+
+# Prometheus 指标（含归一化的 SQL 与路由名），需要 Authorization: Bearer <METRICS_TOKEN>；未设置 METRICS_TOKEN 时不开放
+@app.route("/metrics")
+def metrics_endpoint():
+	token = os.getenv("METRICS_TOKEN")
+	if not token or not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+		return {"error": "unauthorized"}, 401
+	return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # 健康检查路由
 @app.route("/health")
 def health_check():
-	return {"status": "ok", "message": "应用运行正常"}, 200
+	result = {"status": "ok", "message": "应用运行正常"}
+	# PostgreSQL连接池指标（借出/空闲/等待时间），用于压测时调整池大小
+	stats = pool_stats()
+	if stats is not None:
+		result["db_pool"] = stats
+	# 作者页面缓存的命中率
+	result["view_cache"] = view_cache.stats()
+	result["compression"] = dict(compression.stats)
+	result["ratelimit"] = ratelimit.stats()
+	result["outbox"] = dict(outbox.stats)
+	result["notification_stream"] = notification_stream.stats()
+	result["slow_queries"] = dict(slow_query.stats, threshold_ms=slow_query.SLOW_QUERY_MS)
+	# 数据库版本落后（AUTO_MIGRATE=0 且未执行 migrate）时报告未就绪
+	result["schema_ready"] = schema_ready()
+	if not result["schema_ready"]:
+		result["status"] = "not_ready"
+		result["message"] = "数据库结构未就绪"
+		return result, 503
+	return result, 200
+
+
+# 定时分发通知事件（Vercel Cron 或外部调度器调用），需要 Authorization: Bearer <CRON_SECRET>
+@app.route("/cron/outbox")
+def cron_outbox():
+	secret = os.getenv("CRON_SECRET")
+	if not secret or not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {secret}"):
+		return {"error": "unauthorized"}, 401
+	dispatched = outbox.drain(max_batches=request.args.get("max_batches", 20, type=int))
+	return {"dispatched": dispatched, "backlog": outbox.backlog()}, 200
 
 
 
@@ -0,0 +1,140 @@
+"""静态资源：指纹文件名、预压缩与按 Accept-Encoding 发送
+
+`python manage.py build-assets` 把 static/ 下的文件复制为 static/dist/<名称>.<哈希>.<扩展名>，
+同时生成 .gz（以及安装了 brotli 时的 .br）预压缩版本和 manifest.json。
+url_for('static', filename='style.css') 会自动换成带指纹的路径，这类文件内容不会变化，
+发送时带一年的 immutable 缓存头。
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+
+# 值得预压缩的文本类资源
+COMPRESSIBLE = {".css", ".js", ".svg", ".html", ".json", ".txt", ".xml", ".map"}
+
+# 带指纹的文件缓存一年；其他静态文件缓存较短时间
+IMMUTABLE_MAX_AGE = 31536000
+DEFAULT_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+
+_manifest = None
+
+
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _source_files(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir) and DIST_DIR in dirs:
+            dirs.remove(DIST_DIR)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, static_dir).replace(os.sep, "/"), path
+
+
+def build(static_dir=STATIC_DIR):
+    """生成带指纹的文件、预压缩版本和 manifest，返回 manifest
+
+    manifest 格式：{源文件: {"file": 指纹文件相对static的路径, "sha256": 源文件摘要}}
+    """
+    dist = os.path.join(static_dir, DIST_DIR)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    os.makedirs(dist)
+
+    manifest = {}
+    for name, path in _source_files(static_dir):
+        sha = _digest(path)
+        stem, ext = os.path.splitext(name)
+        hashed = f"{DIST_DIR}/{stem}.{sha[:10]}{ext}"
+        target = os.path.join(static_dir, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+
+        if ext.lower() in COMPRESSIBLE:
+            with open(path, "rb") as f:
+                data = f.read()
+            # mtime=0 保证同样的输入生成同样的 .gz
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                with open(target + ".gz", "wb") as f:
+                    f.write(gz)
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(data):
+                    with open(target + ".br", "wb") as f:
+                        f.write(br)
+        manifest[name] = {"file": hashed, "sha256": sha}
+
+    with open(os.path.join(dist, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    reload_manifest()
+    return manifest
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    """读取 manifest（进程内缓存），只保留与当前源文件一致的条目
+
+    修改了静态文件却没有重新 build-assets 时，该文件回退为原路径，不会发送旧内容。
+    """
+    global _manifest
+    if _manifest is not None:
+        return _manifest
+    manifest = {}
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME), encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    for name, entry in entries.items():
+        source = os.path.join(static_dir, name)
+        try:
+            if _digest(source) != entry["sha256"]:
+                print(f"Static asset {name} changed since last build-assets, serving unhashed file")
+                continue
+        except (OSError, KeyError, TypeError):
+            continue
+        manifest[name] = entry["file"]
+    _manifest = manifest
+    return manifest
+
+
+def reload_manifest():
+    global _manifest
+    _manifest = None
+
+
+def hashed_name(filename):
+    """返回带指纹的路径；没有构建过的文件原样返回"""
+    return load_manifest().get(filename, filename)
+
+
+def is_immutable(filename):
+    # dist/ 下的文件名包含内容哈希
+    return filename.startswith(DIST_DIR + "/") and filename != f"{DIST_DIR}/{MANIFEST_NAME}"
+
+
+def pick_variant(filename, accept_encodings, static_dir=STATIC_DIR):
+    """按客户端支持的编码选择预压缩文件，返回 (相对路径, Content-Encoding 或 None)"""
+    if os.path.splitext(filename)[1].lower() in COMPRESSIBLE:
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if accept_encodings[encoding] and os.path.isfile(os.path.join(static_dir, filename + suffix)):
+                return filename + suffix, encoding
+    return filename, None
+
+
+def guess_mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
@@ -0,0 +1,53 @@
+"""页面数据的版本戳
+
+change_stamps 表按作用域记录版本号和最后修改时间（Unix 秒）：
+    user:<id>  某个作者的签约、申请、稿费、通知
+    books      全部书籍列表
+写操作在自己的事务里用 bump / bump_statements 递增版本，条件GET据此生成 ETag，
+多进程部署下各进程看到的版本一致。
+"""
+import time
+
+from db_hybrid import get_db, adapt_query, in_clause, execute_query_all, execute_many
+
+_BUMP = """
+    INSERT INTO change_stamps (scope, version, updated_at) VALUES (?, 1, ?)
+    ON CONFLICT (scope) DO UPDATE SET version = change_stamps.version + 1, updated_at = excluded.updated_at
+"""
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def bump_statements(scopes):
+    """递增版本的语句 [(query, params)]，供调用方并入 execute_batch"""
+    now = int(time.time())
+    return [(adapt_query(_BUMP), (scope, now)) for scope in sorted(set(scopes))]
+
+
+def bump(conn, scopes):
+    """递增这些作用域的版本（由调用方提交）"""
+    scopes = sorted(set(scopes))
+    if scopes:
+        now = int(time.time())
+        execute_many(conn, adapt_query(_BUMP), [(scope, now) for scope in scopes])
+
+
+def read(scopes):
+    """返回 ({作用域: 版本}, 最后修改时间)；没有记录的作用域版本为0"""
+    scopes = list(scopes)
+    with get_db() as conn:
+        if conn is None:
+            return {scope: 0 for scope in scopes}, 0
+        scopes_sql, scopes_params = in_clause("scope", scopes)
+        rows = execute_query_all(conn,
+            adapt_query(f"SELECT scope, version, updated_at FROM change_stamps WHERE {scopes_sql}"),
+            scopes_params,
+        )
+    versions = {scope: 0 for scope in scopes}
+    last_modified = 0
+    for scope, version, updated_at in rows:
+        versions[scope] = version
+        last_modified = max(last_modified, updated_at or 0)
+    return versions, last_modified
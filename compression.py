@@ -0,0 +1,177 @@
+"""响应压缩（WSGI 中间件）
+
+客户端接受 gzip 时压缩 HTML / JSON / 文本类响应：
+- 已知长度且小于 COMPRESS_MIN_SIZE 的响应不压缩；
+- 已有 Content-Encoding（如预压缩的静态文件）、图片等已压缩类型和 text/event-stream 不压缩；
+- 没有 Content-Length 的流式响应逐块压缩并 Z_SYNC_FLUSH，客户端可以边收边解压。
+"""
+import os
+import threading
+import time
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
+
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "500"))
+
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/css", "text/plain", "text/csv", "text/xml", "text/javascript",
+    "application/json", "application/x-ndjson", "application/javascript", "application/xml",
+    "image/svg+xml",
+)
+# 即使是文本也不压缩：SSE 需要每条消息立即送达
+EXCLUDED_TYPES = ("text/event-stream",)
+
+# 进程内累计指标
+stats = {
+    "compressed": 0,
+    "skipped": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "cpu_seconds": 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def _record(compressed, bytes_in=0, bytes_out=0, cpu=0.0):
+    with _stats_lock:
+        stats["compressed" if compressed else "skipped"] += 1
+        stats["bytes_in"] += bytes_in
+        stats["bytes_out"] += bytes_out
+        stats["cpu_seconds"] += cpu
+
+
+def _gzip_compressor(level):
+    # wbits=31：输出带 gzip 头和尾
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def compress_bytes(data, level=COMPRESS_LEVEL):
+    compressor = _gzip_compressor(level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def accepts_gzip(environ):
+    accept = parse_accept_header(environ.get("HTTP_ACCEPT_ENCODING", ""))
+    return accept["gzip"] > 0
+
+
+def _no_write(data):
+    raise RuntimeError("CompressionMiddleware does not support the WSGI write() callable")
+
+
+class CompressionMiddleware:
+    def __init__(self, app, level=None, min_size=None):
+        self.app = app
+        self.level = COMPRESS_LEVEL if level is None else level
+        self.min_size = COMPRESS_MIN_SIZE if min_size is None else min_size
+
+    def __call__(self, environ, start_response):
+        if self.level <= 0 or environ.get("REQUEST_METHOD") == "HEAD" or not accepts_gzip(environ):
+            return self.app(environ, start_response)
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return _no_write
+
+        app_iter = self.app(environ, capture)
+        chunks = iter(app_iter)
+        pending = []
+        # 少数应用在第一次迭代时才调用 start_response
+        while not captured:
+            try:
+                pending.append(next(chunks))
+            except StopIteration:
+                break
+        close = getattr(app_iter, "close", None)
+        if not captured:
+            # 迭代结束仍未调用 start_response，违反 WSGI 约定，明确报错而不是解包失败
+            if close:
+                close()
+            raise RuntimeError("application did not call start_response")
+
+        status, header_list, exc_info = captured
+        headers = Headers(header_list)
+        mode = self._mode(status, headers)
+        if mode is None:
+            start_response(status, header_list, exc_info)
+            return ClosingIterator(self._passthrough(pending, chunks), close)
+
+        headers["Content-Encoding"] = "gzip"
+        vary = headers.get("Vary")
+        if not vary:
+            headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            headers["Vary"] = vary + ", Accept-Encoding"
+        # 压缩后的表示与原表示字节不同，强 ETag 改为弱 ETag
+        etag = headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+
+        if mode == "buffer":
+            try:
+                body = b"".join(pending) + b"".join(chunks)
+            finally:
+                if close:
+                    close()
+            started = time.thread_time()
+            compressed = compress_bytes(body, self.level)
+            _record(True, len(body), len(compressed), time.thread_time() - started)
+            headers["Content-Length"] = str(len(compressed))
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return [compressed]
+
+        headers.remove("Content-Length")
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return ClosingIterator(self._stream(pending, chunks), close)
+
+    def _mode(self, status, headers):
+        """返回 None（不压缩）、"buffer"（已知长度，整体压缩）或 "stream"（逐块压缩）"""
+        code = int(status.split(" ", 1)[0])
+        content_type = headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+        if (code < 200 or code in (204, 206, 304)
+                or "Content-Encoding" in headers
+                or "no-transform" in headers.get("Cache-Control", "")
+                or content_type in EXCLUDED_TYPES
+                or content_type not in COMPRESSIBLE_TYPES):
+            _record(False)
+            return None
+        length = headers.get("Content-Length")
+        if length is None:
+            return "stream"
+        if int(length) < self.min_size:
+            _record(False)
+            return None
+        return "buffer"
+
+    @staticmethod
+    def _passthrough(pending, chunks):
+        yield from pending
+        yield from chunks
+
+    def _stream(self, pending, chunks):
+        compressor = _gzip_compressor(self.level)
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        try:
+            for source in (pending, chunks):
+                for chunk in source:
+                    if not chunk:
+                        continue
+                    started = time.thread_time()
+                    # 每块都同步刷新，避免流式响应被压缩器攒住
+                    out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                    cpu += time.thread_time() - started
+                    bytes_in += len(chunk)
+                    bytes_out += len(out)
+                    yield out
+            out = compressor.flush()
+            bytes_out += len(out)
+            yield out
+        finally:
+            _record(True, bytes_in, bytes_out, cpu)
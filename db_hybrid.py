@@ -1,7 +1,12 @@
 import os
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
 
+import metrics
+import slow_query
+
 # 检测是否在Vercel环境中运行
 IS_VERCEL = os.getenv("VERCEL") is not None
 
@@ -9,6 +14,7 @@ if IS_VERCEL:
     # 在Vercel环境中，尝试使用PostgreSQL
     try:
         import psycopg2
+        import psycopg2.extensions
         from psycopg2.extras import RealDictCursor
         from urllib.parse import urlparse
         POSTGRES_AVAILABLE = True
@@ -41,53 +47,539 @@ def get_db_url():
     
     return None
 
+class PoolExhausted(Exception):
+    """连接池在等待超时或等待队列已满时抛出"""
+
+
+class PostgresPool:
+    """进程内PostgreSQL连接池
+
+    - 借出时做健康检查：空闲超过 health_check_idle 秒的连接先执行 SELECT 1
+    - 连接存活超过 max_lifetime 秒后关闭重建
+    - 连接用尽时排队等待，等待者数量(max_waiting)和等待时间(timeout)都有上限
+    """
+
+    def __init__(self, connect_kwargs, max_size=10, max_lifetime=1800,
+                 timeout=5.0, max_waiting=50, health_check_idle=5.0):
+        self.connect_kwargs = connect_kwargs
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.max_waiting = max_waiting
+        self.health_check_idle = health_check_idle
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = []      # [(conn, created_at, returned_at)]
+        self._created = {}   # id(conn) -> created_at（包括借出中的连接）
+        self._size = 0       # 已建立 + 正在建立的连接数
+        self._waiting = 0
+
+        # 指标
+        self.borrowed = 0
+        self.borrow_total = 0
+        self.created_total = 0
+        self.recycled_total = 0
+        self.health_check_failures = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _reserve(self, start):
+        """在锁内取一个空闲连接，或为新连接占一个名额；返回空闲项或None(表示需新建)"""
+        while True:
+            if self._idle:
+                return self._idle.pop()
+            if self._size < self.max_size:
+                self._size += 1
+                return None
+            if self._waiting >= self.max_waiting:
+                self.timeouts += 1
+                raise PoolExhausted(f"连接池等待队列已满（{self.max_waiting}）")
+            remaining = self.timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                self.timeouts += 1
+                raise PoolExhausted(f"等待数据库连接超时（{self.timeout}s）")
+            self._waiting += 1
+            try:
+                self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+    def _check(self, conn, created_at, returned_at):
+        """借出前检查连接：返回None表示可用，否则返回丢弃原因"""
+        now = time.monotonic()
+        if conn.closed:
+            return "closed"
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return "recycled"
+        if now - returned_at > self.health_check_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            except Exception:
+                return "unhealthy"
+        return None
+
+    def _release_slot(self, conn=None):
+        """在锁内释放一个连接名额"""
+        self._size -= 1
+        if conn is not None:
+            self._created.pop(id(conn), None)
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._cond.notify()
+
+    def getconn(self):
+        start = time.monotonic()
+        while True:
+            with self._cond:
+                entry = self._reserve(start)
+            if entry is None:
+                break
+            # 健康检查在锁外进行，避免一次网络往返阻塞其他借用者
+            conn, created_at, returned_at = entry
+            reason = self._check(conn, created_at, returned_at)
+            with self._cond:
+                if reason is None:
+                    return self._checkout(conn, start)
+                if reason == "recycled":
+                    self.recycled_total += 1
+                elif reason == "unhealthy":
+                    self.health_check_failures += 1
+                self._release_slot(conn)
+
+        # 新建连接（TLS握手在锁外进行）
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+            # 设置自动提交
+            conn.autocommit = True
+        except Exception:
+            with self._cond:
+                self._release_slot()
+            raise
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+            self.created_total += 1
+            return self._checkout(conn, start)
+
+    def _checkout(self, conn, start):
+        waited = time.monotonic() - start
+        self.borrowed += 1
+        self.borrow_total += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        return conn
+
+    def putconn(self, conn):
+        reusable = not conn.closed
+        if reusable:
+            try:
+                # 归还前结束未提交的事务并恢复自动提交
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = True
+            except Exception:
+                reusable = False
+        with self._cond:
+            self.borrowed -= 1
+            created_at = self._created.get(id(conn))
+            if reusable and created_at is not None:
+                self._idle.append((conn, created_at, time.monotonic()))
+                self._cond.notify()
+            else:
+                self._release_slot(conn)
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                self._release_slot(self._idle.pop()[0])
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "max_size": self.max_size,
+                "borrowed": self.borrowed,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "borrow_total": self.borrow_total,
+                "created_total": self.created_total,
+                "recycled_total": self.recycled_total,
+                "health_check_failures": self.health_check_failures,
+                "timeouts": self.timeouts,
+                "wait_time_total": round(self.wait_time_total, 6),
+                "wait_time_max": round(self.wait_time_max, 6),
+                "wait_time_avg": round(self.wait_time_total / self.borrow_total, 6) if self.borrow_total else 0.0,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取进程内的PostgreSQL连接池（按需创建，fork后重建）"""
+    global _pool
+    if _pool is not None and _pool.pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            db_url = get_db_url()
+            if not db_url:
+                return None
+            # 解析数据库URL（每个进程只解析一次）
+            parsed = urlparse(db_url)
+            _pool = PostgresPool(
+                dict(
+                    host=parsed.hostname,
+                    port=parsed.port,
+                    database=parsed.path[1:],  # 移除开头的 '/'
+                    user=parsed.username,
+                    password=parsed.password,
+                    sslmode='require'  # Vercel Postgres需要SSL
+                ),
+                max_size=int(os.getenv('PG_POOL_MAX', '10')),
+                max_lifetime=float(os.getenv('PG_POOL_MAX_LIFETIME', '1800')),
+                timeout=float(os.getenv('PG_POOL_TIMEOUT', '5')),
+                max_waiting=int(os.getenv('PG_POOL_MAX_WAITING', '50')),
+                health_check_idle=float(os.getenv('PG_POOL_HEALTH_CHECK_IDLE', '5')),
+            )
+    return _pool
+
+
+def connect_dedicated():
+    """打开一个不属于连接池的PostgreSQL连接（自动提交），用于 LISTEN 这类长期占用连接的场景"""
+    pool = get_pool()
+    if pool is None:
+        return None
+    conn = psycopg2.connect(**pool.connect_kwargs)
+    conn.autocommit = True
+    return conn
+
+
+def pool_stats():
+    """返回连接池指标，未使用PostgreSQL时返回None"""
+    if not (POSTGRES_AVAILABLE and IS_VERCEL) or _pool is None:
+        return None
+    return _pool.stats()
+
+
+SQLITE_PATH = os.getenv("SQLITE_PATH") or os.path.join(os.path.dirname(__file__), "data.sqlite3")
+
+_sqlite_local = threading.local()
+
+
+def _open_sqlite_conn():
+    """打开SQLite连接并设置性能相关的PRAGMA
+
+    WAL模式下读不阻塞写、写不阻塞读；synchronous=NORMAL在WAL下只在检查点时fsync。
+    """
+    busy_timeout_ms = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    cache_kb = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+    mmap_size = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+
+    conn = sqlite3.connect(SQLITE_PATH, timeout=busy_timeout_ms / 1000)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+    # 负数表示以KiB为单位
+    conn.execute(f"PRAGMA cache_size=-{cache_kb}")
+    conn.execute(f"PRAGMA mmap_size={mmap_size}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_sqlite_conn():
+    """获取当前线程的SQLite连接（按需创建，fork后重建）"""
+    conn = getattr(_sqlite_local, "conn", None)
+    if conn is None or _sqlite_local.pid != os.getpid():
+        conn = _open_sqlite_conn()
+        _sqlite_local.conn = conn
+        _sqlite_local.pid = os.getpid()
+        _sqlite_local.depth = 0
+    return conn
+
+
+def close_sqlite_conn():
+    """关闭当前线程的SQLite连接"""
+    conn = getattr(_sqlite_local, "conn", None)
+    if conn is not None:
+        _sqlite_local.conn = None
+        if _sqlite_local.pid == os.getpid():
+            conn.close()
+
+
 @contextmanager
 def get_db():
     """获取数据库连接"""
     if POSTGRES_AVAILABLE and IS_VERCEL:
-        # 在Vercel环境中，使用PostgreSQL
-        db_url = get_db_url()
-        
-        if not db_url:
+        # 在Vercel环境中，使用PostgreSQL连接池
+        pool = get_pool()
+        if pool is None:
             print("No PostgreSQL URL available, using fallback")
             yield None
             return
-        
+
+        started = time.perf_counter()
         try:
-            # 解析数据库URL
-            parsed = urlparse(db_url)
-            
-            # 创建连接
-            conn = psycopg2.connect(
-                host=parsed.hostname,
-                port=parsed.port,
-                database=parsed.path[1:],  # 移除开头的 '/'
-                user=parsed.username,
-                password=parsed.password,
-                sslmode='require'  # Vercel Postgres需要SSL
-            )
-            
-            # 设置自动提交
-            conn.autocommit = True
-            
-            try:
-                yield conn
-            finally:
-                conn.close()
-                
+            conn = pool.getconn()
         except Exception as e:
             print(f"PostgreSQL connection error: {e}")
             # 如果连接失败，返回None
             yield None
+            return
+        metrics.CONNECTION_ACQUIRE.observe(time.perf_counter() - started, "postgres")
+
+        try:
+            yield conn
+        finally:
+            pool.putconn(conn)
     else:
-        # 在本地环境中，使用SQLite
-        db_path = os.path.join(os.path.dirname(__file__), "data.sqlite3")
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
+        # 在本地环境中，使用SQLite（每个线程复用一个连接）
+        started = time.perf_counter()
+        conn = get_sqlite_conn()
+        metrics.CONNECTION_ACQUIRE.observe(time.perf_counter() - started, "sqlite")
+        _sqlite_local.depth += 1
         try:
             yield conn
         finally:
-            conn.close()
+            _sqlite_local.depth -= 1
+            # 连接不关闭，但最外层退出时丢弃未提交的修改，保持与原来关闭连接时相同的语义
+            if _sqlite_local.depth == 0 and conn.in_transaction:
+                conn.rollback()
+
+def adapt_query(query):
+    """把 ? 占位符转换为当前数据库的占位符（PostgreSQL 为 %s）"""
+    if POSTGRES_AVAILABLE and IS_VERCEL:
+        return query.replace("?", "%s")
+    return query
+
+
+def in_clause(column, values):
+    """生成集合条件，返回 (sql, params)，sql 中的占位符为 ?
+
+    PostgreSQL 用 column = ANY(?) 传一个数组参数，SQLite 展开为 column IN (?, ?, ...)。
+    """
+    values = list(values)
+    if POSTGRES_AVAILABLE and IS_VERCEL:
+        return f"{column} = ANY(?)", [values]
+    if not values:
+        return "1 = 0", []
+    return f"{column} IN ({', '.join('?' * len(values))})", values
+
+
+# 处于 transaction() 中的连接（按 id 记录）
+_tx_conns = set()
+# 连接 id -> 提交后要执行的回调
+_after_commit = {}
+
+
+def in_transaction(conn):
+    """连接是否处于 transaction() 工作单元中"""
+    return id(conn) in _tx_conns
+
+
+def after_commit(conn, func):
+    """在 transaction() 提交之后调用 func（如失效进程内缓存），回滚时丢弃；
+    连接不在事务中时（语句已各自提交）立即调用"""
+    key = id(conn)
+    if key in _tx_conns:
+        _after_commit.setdefault(key, []).append(func)
+    else:
+        func()
+
+
+@contextmanager
+def transaction(conn):
+    """显式事务（工作单元）
+
+    块内的 execute_update / execute_many / execute_batch 不再各自提交，
+    正常退出时统一提交一次，出现异常时整体回滚。嵌套使用时并入外层事务。
+    PostgreSQL 下临时关闭自动提交；SQLite 下使用 BEGIN IMMEDIATE 先拿写锁，
+    避免读后写时因快照过期而失败。after_commit 登记的回调在提交成功后执行。
+    """
+    key = id(conn)
+    if key in _tx_conns:
+        yield conn
+        return
+
+    is_postgres = POSTGRES_AVAILABLE and IS_VERCEL
+    if is_postgres:
+        conn.autocommit = False
+    elif not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    _tx_conns.add(key)
+    _after_commit.pop(key, None)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _tx_conns.discard(key)
+        callbacks = _after_commit.pop(key, ())
+        if is_postgres:
+            conn.autocommit = True
+    # 只有提交成功才会执行到这里
+    for func in callbacks:
+        try:
+            func()
+        except Exception as e:
+            print(f"After-commit callback failed: {e}")
+
+
+@contextmanager
+def _observe(query, conn=None, params=None):
+    """记录语句耗时（按归一化的 SQL 计入 db_query_duration_seconds）；成功执行且超过阈值时写慢查询日志
+
+    conn 为 None 时慢查询日志不附执行计划。
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe_query(query, elapsed)
+    if slow_query.THRESHOLD is not None and elapsed >= slow_query.THRESHOLD:
+        slow_query.record(conn, query, params, elapsed, postgres=POSTGRES_AVAILABLE and IS_VERCEL)
+
+
+def execute_query(conn, query, params=None):
+    """执行数据库查询，兼容PostgreSQL和SQLite"""
+    with _observe(query, conn, params):
+        if POSTGRES_AVAILABLE and IS_VERCEL:
+            # PostgreSQL查询
+            with conn.cursor() as cur:
+                cur.execute(query, params or ())
+                return cur.fetchone()
+        else:
+            # SQLite查询
+            return conn.execute(query, params or ()).fetchone()
+
+
+def execute_query_all(conn, query, params=None):
+    """执行数据库查询并返回所有结果，兼容PostgreSQL和SQLite"""
+    with _observe(query, conn, params):
+        if POSTGRES_AVAILABLE and IS_VERCEL:
+            # PostgreSQL查询
+            with conn.cursor() as cur:
+                cur.execute(query, params or ())
+                return cur.fetchall()
+        else:
+            # SQLite查询
+            return conn.execute(query, params or ()).fetchall()
+
+
+def iter_query(conn, query, params=None, batch_size=1000):
+    """逐批读取查询结果，每次产出一批行（列表），内存占用与结果总行数无关
+
+    PostgreSQL 使用命名（服务端）游标，需要在事务中执行，读完后提交；
+    SQLite 使用普通游标的 fetchmany。生成器提前关闭时游标和事务一并释放。
+    """
+    if POSTGRES_AVAILABLE and IS_VERCEL:
+        import uuid
+        with transaction(conn):
+            with conn.cursor(name=f"iter_{uuid.uuid4().hex}") as cur:
+                cur.itersize = batch_size
+                with _observe(query):
+                    cur.execute(query, params or ())
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+    else:
+        with _observe(query, conn, params):
+            cur = conn.execute(query, params or ())
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
+
+def execute_update(conn, query, params=None):
+    """执行数据库更新操作，兼容PostgreSQL和SQLite，返回受影响的行数
+
+    在 transaction() 中调用时不单独提交。
+    """
+    with _observe(query, conn, params):
+        if POSTGRES_AVAILABLE and IS_VERCEL:
+            # PostgreSQL查询
+            with conn.cursor() as cur:
+                cur.execute(query, params or ())
+                return cur.rowcount
+        else:
+            # SQLite查询
+            cur = conn.execute(query, params or ())
+            if not in_transaction(conn):
+                conn.commit()
+            return cur.rowcount
+
+
+def execute_many(conn, query, params_seq):
+    """用同一条语句批量执行多组参数"""
+    # 执行计划按第一组参数获取
+    with _observe(query, conn, params_seq[0] if isinstance(params_seq, (list, tuple)) and params_seq else None):
+        if POSTGRES_AVAILABLE and IS_VERCEL:
+            from psycopg2.extras import execute_batch as pg_execute_batch
+            with conn.cursor() as cur:
+                # 每页多组参数合并为一次往返
+                pg_execute_batch(cur, query, params_seq, page_size=500)
+        else:
+            conn.executemany(query, params_seq)
+            if not in_transaction(conn):
+                conn.commit()
+
+
+def execute_values(conn, query, rows, page_size=1000):
+    """批量插入多行，query 中用 {values} 表示 VALUES 后的行，如
+    "INSERT INTO t (a, b) VALUES {values} ON CONFLICT ..."
+
+    PostgreSQL 下用 psycopg2 的 execute_values 每页拼成一条多行 INSERT；SQLite 下逐行 executemany。
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    # 单行形式的语句：SQLite 直接执行，也用于计时标签与慢查询日志中的执行计划（按第一行参数获取）
+    single_row = adapt_query(query.format(values="(" + ", ".join("?" * len(rows[0])) + ")"))
+    with _observe(single_row, conn, rows[0]):
+        if POSTGRES_AVAILABLE and IS_VERCEL:
+            from psycopg2.extras import execute_values as pg_execute_values
+            with conn.cursor() as cur:
+                pg_execute_values(cur, query.format(values="%s"), rows, page_size=page_size)
+        else:
+            conn.executemany(single_row, rows)
+            if not in_transaction(conn):
+                conn.commit()
+
+
+def execute_batch(conn, statements):
+    """依次执行多条不同的语句 [(query, params)]
+
+    PostgreSQL 下把各语句在客户端绑定参数后用分号拼接，一次往返发送。
+    """
+    if POSTGRES_AVAILABLE and IS_VERCEL:
+        with conn.cursor() as cur:
+            sql = b"; ".join(cur.mogrify(query, params or ()) for query, params in statements)
+            # 一次往返，按拼接后的整批语句计时
+            with _observe("; ".join(query for query, _ in statements)):
+                cur.execute(sql)
+    else:
+        for query, params in statements:
+            with _observe(query, conn, params):
+                conn.execute(query, params or ())
+        if not in_transaction(conn):
+            conn.commit()
+
 
 def init_db():
     """初始化数据库表"""
@@ -95,223 +587,356 @@ def init_db():
         if conn is None:
             print("No database connection available, skipping initialization")
             return
-        
-        if POSTGRES_AVAILABLE and IS_VERCEL:
-            # PostgreSQL表结构
-            with conn.cursor() as cur:
-                # 创建用户表
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id SERIAL PRIMARY KEY,
-                        username VARCHAR(50) UNIQUE NOT NULL,
-                        password_hash VARCHAR(255) NOT NULL,
-                        role VARCHAR(20) NOT NULL CHECK(role IN ('admin','author'))
-                    );
-                """)
-                
-                # 创建书籍表
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS books (
-                        id SERIAL PRIMARY KEY,
-                        title VARCHAR(255) NOT NULL,
-                        author_id INTEGER NOT NULL,
-                        pen_name VARCHAR(100),
-                        contract_type VARCHAR(20) CHECK(contract_type IN ('保底','买断')),
-                        buyout_amount DECIMAL(10,2),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY(author_id) REFERENCES users(id)
-                    );
-                """)
-                
-                # 创建稿费表
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS royalties (
-                        id SERIAL PRIMARY KEY,
-                        author_id INTEGER NOT NULL,
-                        month VARCHAR(7) NOT NULL,
-                        amount DECIMAL(10,2) NOT NULL DEFAULT 0,
-                        book_id INTEGER,
-                        FOREIGN KEY(author_id) REFERENCES users(id),
-                        FOREIGN KEY(book_id) REFERENCES books(id)
-                    );
-                """)
-                
-                # 创建申请表
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS applications (
-                        id SERIAL PRIMARY KEY,
-                        author_id INTEGER NOT NULL,
-                        title VARCHAR(255) NOT NULL,
-                        pen_name VARCHAR(100) NOT NULL,
-                        contract_type VARCHAR(20) NOT NULL CHECK(contract_type IN ('保底','买断')),
-                        status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK(status IN ('pending','approved','rejected')),
-                        reject_reason TEXT,
-                        reviewer_id INTEGER,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        processed_at TIMESTAMP,
-                        FOREIGN KEY(author_id) REFERENCES users(id),
-                        FOREIGN KEY(reviewer_id) REFERENCES users(id)
-                    );
-                """)
-                
-                # 创建通知表
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS notifications (
-                        id SERIAL PRIMARY KEY,
-                        recipient_id INTEGER NOT NULL,
-                        message TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        is_read BOOLEAN NOT NULL DEFAULT FALSE,
-                        FOREIGN KEY(recipient_id) REFERENCES users(id)
-                    );
-                """)
-                
-                print("PostgreSQL tables initialized successfully")
-        else:
-            # SQLite表结构
-            conn.execute("""
+
+        create_tables(conn)
+        create_indexes(conn)
+        if not (POSTGRES_AVAILABLE and IS_VERCEL):
+            conn.commit()
+
+def create_tables(conn):
+    """在给定连接上创建数据库表（由调用方提交）"""
+    if POSTGRES_AVAILABLE and IS_VERCEL:
+        # PostgreSQL表结构
+        with conn.cursor() as cur:
+            # 创建用户表
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    role TEXT NOT NULL CHECK(role IN ('admin','author'))
+                    id SERIAL PRIMARY KEY,
+                    username VARCHAR(50) UNIQUE NOT NULL,
+                    password_hash VARCHAR(255) NOT NULL,
+                    role VARCHAR(20) NOT NULL CHECK(role IN ('admin','author'))
                 );
             """)
             
-            conn.execute("""
+            # 创建书籍表
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS books (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
+                    id SERIAL PRIMARY KEY,
+                    title VARCHAR(255) NOT NULL,
                     author_id INTEGER NOT NULL,
-                    pen_name TEXT,
-                    contract_type TEXT CHECK(contract_type IN ('保底','买断')),
-                    buyout_amount REAL,
-                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                    pen_name VARCHAR(100),
+                    contract_type VARCHAR(20) CHECK(contract_type IN ('保底','买断')),
+                    buyout_amount DECIMAL(10,2),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY(author_id) REFERENCES users(id)
                 );
             """)
             
-            conn.execute("""
+            # 创建稿费表
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS royalties (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id SERIAL PRIMARY KEY,
                     author_id INTEGER NOT NULL,
-                    month TEXT NOT NULL,
-                    amount REAL NOT NULL DEFAULT 0,
+                    month VARCHAR(7) NOT NULL,
+                    amount DECIMAL(10,2) NOT NULL DEFAULT 0,
                     book_id INTEGER,
                     FOREIGN KEY(author_id) REFERENCES users(id),
                     FOREIGN KEY(book_id) REFERENCES books(id)
                 );
             """)
             
-            conn.execute("""
+            # 创建申请表
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS applications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id SERIAL PRIMARY KEY,
                     author_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    pen_name TEXT NOT NULL,
-                    contract_type TEXT NOT NULL CHECK(contract_type IN ('保底','买断')),
-                    status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending','approved','rejected')),
+                    title VARCHAR(255) NOT NULL,
+                    pen_name VARCHAR(100) NOT NULL,
+                    contract_type VARCHAR(20) NOT NULL CHECK(contract_type IN ('保底','买断')),
+                    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK(status IN ('pending','approved','rejected')),
                     reject_reason TEXT,
                     reviewer_id INTEGER,
-                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-                    processed_at TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    processed_at TIMESTAMP,
                     FOREIGN KEY(author_id) REFERENCES users(id),
                     FOREIGN KEY(reviewer_id) REFERENCES users(id)
                 );
             """)
             
-            conn.execute("""
+            # 创建通知表
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS notifications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id SERIAL PRIMARY KEY,
                     recipient_id INTEGER NOT NULL,
                     message TEXT NOT NULL,
-                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
-                    is_read INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    is_read BOOLEAN NOT NULL DEFAULT FALSE,
                     FOREIGN KEY(recipient_id) REFERENCES users(id)
                 );
             """)
             
-            conn.commit()
-            print("SQLite tables initialized successfully")
+            print("PostgreSQL tables initialized successfully")
+    else:
+        # SQLite表结构
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                role TEXT NOT NULL CHECK(role IN ('admin','author'))
+            );
+        """)
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                author_id INTEGER NOT NULL,
+                pen_name TEXT,
+                contract_type TEXT CHECK(contract_type IN ('保底','买断')),
+                buyout_amount REAL,
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                FOREIGN KEY(author_id) REFERENCES users(id)
+            );
+        """)
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS royalties (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                author_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                amount REAL NOT NULL DEFAULT 0,
+                book_id INTEGER,
+                FOREIGN KEY(author_id) REFERENCES users(id),
+                FOREIGN KEY(book_id) REFERENCES books(id)
+            );
+        """)
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS applications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                author_id INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                pen_name TEXT NOT NULL,
+                contract_type TEXT NOT NULL CHECK(contract_type IN ('保底','买断')),
+                status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending','approved','rejected')),
+                reject_reason TEXT,
+                reviewer_id INTEGER,
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                processed_at TEXT,
+                FOREIGN KEY(author_id) REFERENCES users(id),
+                FOREIGN KEY(reviewer_id) REFERENCES users(id)
+            );
+        """)
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recipient_id INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                is_read INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY(recipient_id) REFERENCES users(id)
+            );
+        """)
+        
+        print("SQLite tables initialized successfully")
+
+# 热点查询使用的二级索引；修改索引集合时递增 INDEX_VERSION
+INDEX_VERSION = 1
+
+HOT_PATH_INDEXES = [
+    # (索引名, 表名, 列, 是否唯一)
+    # 每本书每月只能有一条稿费记录（book_id 为 NULL 的旧数据不受影响）
+    ("uq_royalties_book_month", "royalties", "book_id, month", True),
+    # author_contracts：按作者 + 月份查当月稿费
+    ("idx_royalties_author_month", "royalties", "author_id, month", False),
+    # author_notifications：WHERE recipient_id=? ORDER BY id DESC
+    ("idx_notifications_recipient", "notifications", "recipient_id, id", False),
+    # author_results：WHERE author_id=? ORDER BY id DESC
+    ("idx_applications_author", "applications", "author_id, id", False),
+    # author_contracts：WHERE author_id=? ORDER BY id DESC
+    ("idx_books_author", "books", "author_id, id", False),
+]
+
+# 用于验证索引是否生效的热点查询：(名称, 表名, SQL, 参数)
+HOT_PATH_QUERIES = [
+    ("author_contracts.books", "books",
+     "SELECT id, title, contract_type, buyout_amount FROM books WHERE author_id=? ORDER BY id DESC", (1,)),
+    ("author_contracts.current", "royalties",
+     "SELECT book_id, amount FROM royalties WHERE author_id=? AND month=? AND book_id IS NOT NULL", (1, "2000-01")),
+    ("author_contracts.month_totals", "royalty_author_months",
+     "SELECT month, total, books FROM royalty_author_months WHERE author_id=? AND month<>? AND month<? ORDER BY month DESC LIMIT 13", (1, "2000-01", "2000-01")),
+    ("author_contracts.history", "royalties",
+     "SELECT book_id, month, amount FROM royalties WHERE author_id=? AND month<>? AND month<=? AND month>=? AND book_id IS NOT NULL ORDER BY month DESC", (1, "2000-01", "1999-12", "1999-01")),
+    ("author_contracts.book_totals", "royalty_book_totals",
+     "SELECT book_id, total, months, last_month FROM royalty_book_totals WHERE author_id=?", (1,)),
+    ("admin_royalties.lookup", "royalties",
+     "SELECT 1 FROM royalties WHERE book_id=? AND month=?", (1, "2000-01")),
+    ("author_results", "applications",
+     "SELECT id, title, pen_name, contract_type, status, reject_reason, created_at FROM applications WHERE author_id=? ORDER BY id DESC", (1,)),
+    ("author_notifications", "notifications",
+     "SELECT id, message, created_at, is_read FROM notifications WHERE recipient_id=? ORDER BY id DESC", (1,)),
+]
+
+
+def _index_exists(conn, name):
+    if POSTGRES_AVAILABLE and IS_VERCEL:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", (name,))
+            return cur.fetchone() is not None
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (name,)).fetchone() is not None
+
+
+def create_indexes(conn):
+    """幂等地创建 HOT_PATH_INDEXES 中的索引（由调用方提交）"""
+    is_postgres = POSTGRES_AVAILABLE and IS_VERCEL
+
+    def run(sql):
+        if is_postgres:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+        else:
+            conn.execute(sql)
+
+    # 建唯一索引前清理重复的 (book_id, month)，保留最新一条
+    if not _index_exists(conn, "uq_royalties_book_month"):
+        run("""
+            DELETE FROM royalties
+            WHERE book_id IS NOT NULL AND id NOT IN (
+                SELECT MAX(id) FROM royalties WHERE book_id IS NOT NULL GROUP BY book_id, month
+            )
+        """)
+
+    for name, table, columns, unique in HOT_PATH_INDEXES:
+        run(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+    print(f"Indexes initialized (version {INDEX_VERSION})")
+
+
+def verify_indexes(conn):
+    """用 EXPLAIN 检查 HOT_PATH_QUERIES 是否走索引
+
+    返回 [{"query", "table", "index_used", "ok", "plan"}]。PostgreSQL 下关闭
+    enable_seqscan，检查的是索引能否被使用（小表上优化器本来就会选择全表扫描）。
+    """
+    results = []
+    if POSTGRES_AVAILABLE and IS_VERCEL:
+        import json
+        with conn.cursor() as cur:
+            cur.execute("SET enable_seqscan = off")
+            try:
+                for label, table, sql, params in HOT_PATH_QUERIES:
+                    cur.execute("EXPLAIN (FORMAT JSON) " + sql.replace("?", "%s"), params)
+                    plan = cur.fetchone()[0]
+                    plan_text = json.dumps(plan, ensure_ascii=False)
+                    nodes = []
+
+                    def walk(node):
+                        nodes.append(node)
+                        for child in node.get("Plans", []):
+                            walk(child)
+
+                    walk(plan[0]["Plan"])
+                    index_used = next(
+                        (n.get("Index Name") for n in nodes if n.get("Relation Name") == table and n.get("Index Name")),
+                        None,
+                    )
+                    results.append({"query": label, "table": table, "index_used": index_used,
+                                    "ok": index_used is not None, "plan": plan_text})
+            finally:
+                cur.execute("RESET enable_seqscan")
+    else:
+        for label, table, sql, params in HOT_PATH_QUERIES:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            details = [r[3] for r in rows]
+            index_used = None
+            for d in details:
+                if d.startswith(("SEARCH " + table, "SCAN " + table)) and " INDEX " in d:
+                    index_used = d.split(" INDEX ", 1)[1].split(" ", 1)[0]
+            # 需要临时B树排序说明 ORDER BY 没有被索引覆盖
+            ok = index_used is not None and not any("TEMP B-TREE" in d for d in details)
+            results.append({"query": label, "table": table, "index_used": index_used,
+                            "ok": ok, "plan": "; ".join(details)})
+    return results
+
 
 def add_reviewer_field():
     """为现有数据库添加审核者字段"""
     try:
         with get_db() as conn:
             if conn:
-                if POSTGRES_AVAILABLE and IS_VERCEL:
-                    # PostgreSQL
-                    with conn.cursor() as cur:
-                        # 检查字段是否已存在
-                        cur.execute("""
-                            SELECT column_name 
-                            FROM information_schema.columns 
-                            WHERE table_name='applications' AND column_name='reviewer_id'
-                        """)
-                        if not cur.fetchone():
-                            # 添加审核者字段
-                            cur.execute("""
-                                ALTER TABLE applications 
-                                ADD COLUMN reviewer_id INTEGER REFERENCES users(id)
-                            """)
-                            print("PostgreSQL: 已添加审核者字段")
-                        else:
-                            print("PostgreSQL: 审核者字段已存在")
-                else:
-                    # SQLite
-                    try:
-                        conn.execute("ALTER TABLE applications ADD COLUMN reviewer_id INTEGER REFERENCES users(id)")
-                        conn.commit()
-                        print("SQLite: 已添加审核者字段")
-                    except Exception as e:
-                        if "duplicate column name" in str(e).lower():
-                            print("SQLite: 审核者字段已存在")
-                        else:
-                            print(f"SQLite: 添加审核者字段时出错: {e}")
+                add_reviewer_column(conn)
+                if not (POSTGRES_AVAILABLE and IS_VERCEL):
+                    conn.commit()
     except Exception as e:
         print(f"添加审核者字段时出错: {e}")
 
+def add_reviewer_column(conn):
+    """在给定连接上添加审核者字段（已存在则跳过，由调用方提交）"""
+    if POSTGRES_AVAILABLE and IS_VERCEL:
+        # PostgreSQL
+        with conn.cursor() as cur:
+            # 检查字段是否已存在
+            cur.execute("""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name='applications' AND column_name='reviewer_id'
+            """)
+            if not cur.fetchone():
+                # 添加审核者字段
+                cur.execute("""
+                    ALTER TABLE applications 
+                    ADD COLUMN reviewer_id INTEGER REFERENCES users(id)
+                """)
+                print("PostgreSQL: 已添加审核者字段")
+            else:
+                print("PostgreSQL: 审核者字段已存在")
+    else:
+        # SQLite
+        columns = [r[1] for r in conn.execute("PRAGMA table_info(applications)").fetchall()]
+        if "reviewer_id" not in columns:
+            conn.execute("ALTER TABLE applications ADD COLUMN reviewer_id INTEGER REFERENCES users(id)")
+            print("SQLite: 已添加审核者字段")
+        else:
+            print("SQLite: 审核者字段已存在")
+
 def seed_admin_user():
     """创建默认管理员用户"""
-    from werkzeug.security import generate_password_hash
-    
     with get_db() as conn:
         if conn is None:
             print("No database connection available, skipping admin user creation")
             return
-        
-        if POSTGRES_AVAILABLE and IS_VERCEL:
-            # PostgreSQL
-            with conn.cursor() as cur:
-                # 检查是否已有管理员用户
-                cur.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
-                admin_count = cur.fetchone()[0]
-                
-                if admin_count == 0:
-                    # 创建默认管理员用户
-                    admin_password = os.getenv('ADMIN_PASSWORD', 'admin123')
-                    cur.execute("""
-                        INSERT INTO users (username, password_hash, role) 
-                        VALUES (%s, %s, %s)
-                    """, ('admin', generate_password_hash(admin_password), 'admin'))
-                    
-                    print("Default admin user created: admin / admin123")
-                else:
-                    print("Admin user already exists")
-        else:
-            # SQLite
+
+        create_default_admin(conn)
+        if not (POSTGRES_AVAILABLE and IS_VERCEL):
+            conn.commit()
+
+def create_default_admin(conn):
+    """在给定连接上创建默认管理员用户（已有管理员则跳过，由调用方提交）"""
+    from passwords import hash_password
+    
+    if POSTGRES_AVAILABLE and IS_VERCEL:
+        # PostgreSQL
+        with conn.cursor() as cur:
             # 检查是否已有管理员用户
-            admin_count = conn.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'").fetchone()[0]
+            cur.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
+            admin_count = cur.fetchone()[0]
             
             if admin_count == 0:
                 # 创建默认管理员用户
                 admin_password = os.getenv('ADMIN_PASSWORD', 'admin123')
-                conn.execute("""
+                cur.execute("""
                     INSERT INTO users (username, password_hash, role) 
-                    VALUES (?, ?, ?)
-                """, ('admin', generate_password_hash(admin_password), 'admin'))
+                    VALUES (%s, %s, %s)
+                """, ('admin', hash_password(admin_password), 'admin'))
                 
-                conn.commit()
                 print("Default admin user created: admin / admin123")
             else:
                 print("Admin user already exists")
+    else:
+        # SQLite
+        # 检查是否已有管理员用户
+        admin_count = conn.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'").fetchone()[0]
+        
+        if admin_count == 0:
+            # 创建默认管理员用户
+            admin_password = os.getenv('ADMIN_PASSWORD', 'admin123')
+            conn.execute("""
+                INSERT INTO users (username, password_hash, role) 
+                VALUES (?, ?, ?)
+            """, ('admin', hash_password(admin_password), 'admin'))
+            
+            print("Default admin user created: admin / admin123")
+        else:
+            print("Admin user already exists")
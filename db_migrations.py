@@ -0,0 +1,326 @@
+import os
+
+from db_hybrid import (
+    get_db, transaction, adapt_query, execute_query, execute_update,
+    create_tables, create_indexes, add_reviewer_column, create_default_admin,
+    POSTGRES_AVAILABLE, IS_VERCEL,
+)
+
+# 是否在应用启动时自动执行未应用的迁移（部署时已执行 manage.py migrate 的环境可设为0）
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") != "0"
+
+# PostgreSQL advisory lock 的键，保证多个实例不会同时执行迁移
+_PG_LOCK_KEY = 7304151
+
+# 按版本号顺序排列的迁移：(版本号, 名称, 函数)
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """注册一个迁移；函数接收连接，不需要自己提交"""
+    def decorator(func):
+        MIGRATIONS.append((version, name, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+
+@migration(1, "initial_schema")
+def _initial_schema(conn):
+    create_tables(conn)
+
+
+@migration(2, "add_reviewer_field")
+def _add_reviewer_field(conn):
+    add_reviewer_column(conn)
+
+
+@migration(3, "hot_path_indexes")
+def _hot_path_indexes(conn):
+    create_indexes(conn)
+
+
+@migration(4, "seed_admin_user")
+def _seed_admin_user(conn):
+    create_default_admin(conn)
+
+
+@migration(5, "notification_counters")
+def _notification_counters(conn):
+    import notifications
+    if _is_postgres():
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS notification_counters (
+                    user_id INTEGER PRIMARY KEY,
+                    unread INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+    else:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS notification_counters (
+                user_id INTEGER PRIMARY KEY,
+                unread INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+    notifications.rebuild_counters(conn)
+
+
+@migration(6, "notifications_archive")
+def _notifications_archive(conn):
+    if _is_postgres():
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS notifications_archive (
+                    id INTEGER PRIMARY KEY,
+                    recipient_id INTEGER NOT NULL,
+                    message TEXT NOT NULL,
+                    created_at TIMESTAMP,
+                    is_read BOOLEAN NOT NULL DEFAULT TRUE,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+    else:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS notifications_archive (
+                id INTEGER PRIMARY KEY,
+                recipient_id INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                created_at TEXT,
+                is_read INTEGER NOT NULL DEFAULT 1,
+                archived_at TEXT NOT NULL DEFAULT (datetime('now'))
+            );
+        """)
+    # 归档任务按 created_at 扫描已读通知
+    execute_update(conn, "CREATE INDEX IF NOT EXISTS idx_notifications_read_created ON notifications(created_at) WHERE is_read = TRUE")
+    execute_update(conn, "CREATE INDEX IF NOT EXISTS idx_notifications_archive_recipient ON notifications_archive(recipient_id, id)")
+
+
+@migration(7, "royalty_rollups")
+def _royalty_rollups(conn):
+    import royalty_rollups
+    amount_type = "NUMERIC(14,2)" if _is_postgres() else "REAL"
+    statements = [
+        f"""
+            CREATE TABLE IF NOT EXISTS royalty_author_months (
+                author_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                total {amount_type} NOT NULL DEFAULT 0,
+                books INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (author_id, month)
+            )
+        """,
+        f"""
+            CREATE TABLE IF NOT EXISTS royalty_book_totals (
+                book_id INTEGER PRIMARY KEY,
+                author_id INTEGER NOT NULL,
+                total {amount_type} NOT NULL DEFAULT 0,
+                months INTEGER NOT NULL DEFAULT 0,
+                last_month TEXT
+            )
+        """,
+        f"""
+            CREATE TABLE IF NOT EXISTS royalty_month_totals (
+                month TEXT PRIMARY KEY,
+                total {amount_type} NOT NULL DEFAULT 0,
+                books INTEGER NOT NULL DEFAULT 0,
+                authors INTEGER NOT NULL DEFAULT 0
+            )
+        """,
+        # 月合计按月份累加作者月汇总
+        "CREATE INDEX IF NOT EXISTS idx_royalty_author_months_month ON royalty_author_months(month)",
+        "CREATE INDEX IF NOT EXISTS idx_royalty_book_totals_author ON royalty_book_totals(author_id)",
+    ]
+    for sql in statements:
+        execute_update(conn, sql)
+    royalty_rollups.rebuild(conn)
+
+
+@migration(8, "change_stamps")
+def _change_stamps(conn):
+    int_type = "BIGINT" if _is_postgres() else "INTEGER"
+    execute_update(conn, f"""
+        CREATE TABLE IF NOT EXISTS change_stamps (
+            scope VARCHAR(64) PRIMARY KEY,
+            version {int_type} NOT NULL DEFAULT 0,
+            updated_at {int_type} NOT NULL DEFAULT 0
+        )
+    """)
+
+
+@migration(9, "outbox")
+def _outbox(conn):
+    if _is_postgres():
+        id_column, time_type = "id SERIAL PRIMARY KEY", "DOUBLE PRECISION"
+    else:
+        id_column, time_type = "id INTEGER PRIMARY KEY AUTOINCREMENT", "REAL"
+    execute_update(conn, f"""
+        CREATE TABLE IF NOT EXISTS outbox (
+            {id_column},
+            event_type VARCHAR(50) NOT NULL,
+            recipient_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at {time_type} NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at {time_type} NOT NULL,
+            notified_at {time_type},
+            dispatched_at {time_type},
+            last_error TEXT
+        )
+    """)
+    # 分发器只扫描未完成的事件
+    execute_update(conn, "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(next_attempt_at) WHERE dispatched_at IS NULL")
+
+
+@migration(10, "notification_trigger")
+def _notification_trigger(conn):
+    # 实时推送：notifications 有新行时 NOTIFY，监听方据此按 id 水位线查询（SQLite 上改为轮询）
+    if not _is_postgres():
+        return
+    execute_update(conn, """
+        CREATE OR REPLACE FUNCTION notify_notifications_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('notifications_changed', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    execute_update(conn, "DROP TRIGGER IF EXISTS notifications_changed ON notifications")
+    # 语句级触发器：批量写入只发一次；同一事务内相同的 NOTIFY 也会被合并
+    execute_update(conn, """
+        CREATE TRIGGER notifications_changed AFTER INSERT ON notifications
+        FOR EACH STATEMENT EXECUTE PROCEDURE notify_notifications_changed()
+    """)
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def _is_postgres():
+    return POSTGRES_AVAILABLE and IS_VERCEL
+
+
+def _create_version_table(conn):
+    if _is_postgres():
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(100) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+    else:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+            );
+        """)
+
+
+def current_version(conn):
+    """返回已应用的最高版本号；schema_version 表不存在时返回0"""
+    try:
+        if _is_postgres():
+            with conn.cursor() as cur:
+                cur.execute("SELECT MAX(version) FROM schema_version")
+                row = cur.fetchone()
+        else:
+            row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except Exception:
+        if _is_postgres() and not conn.autocommit:
+            conn.rollback()
+        return 0
+    return row[0] or 0
+
+
+def applied_migrations(conn):
+    """返回 [(版本号, 名称, 应用时间)]"""
+    _create_version_table(conn)
+    if _is_postgres():
+        with conn.cursor() as cur:
+            cur.execute("SELECT version, name, applied_at FROM schema_version ORDER BY version")
+            return cur.fetchall()
+    return conn.execute("SELECT version, name, applied_at FROM schema_version ORDER BY version").fetchall()
+
+
+def _apply_one(conn, version, name, func):
+    """在一个事务中加锁、复查版本并应用单个迁移；已被其他实例应用时返回False
+
+    PostgreSQL 用 advisory lock 串行化，SQLite 由 transaction() 的 BEGIN IMMEDIATE 拿到写锁，
+    其他进程会在 busy_timeout 内等待。
+    """
+    with transaction(conn):
+        if _is_postgres():
+            execute_query(conn, "SELECT pg_advisory_xact_lock(%s)", (_PG_LOCK_KEY,))
+        if current_version(conn) >= version:
+            return False
+        func(conn)
+        execute_update(conn, adapt_query("INSERT INTO schema_version (version, name) VALUES (?, ?)"), (version, name))
+    return True
+
+
+def migrate(conn=None):
+    """应用所有未执行的迁移，返回本次应用的版本号列表"""
+    if conn is None:
+        with get_db() as conn:
+            if conn is None:
+                print("No database connection available, skipping migrations")
+                return []
+            return migrate(conn)
+
+    _create_version_table(conn)
+    if not _is_postgres():
+        conn.commit()
+
+    applied = []
+    version = current_version(conn)
+    for m_version, name, func in MIGRATIONS:
+        if m_version <= version:
+            continue
+        if _apply_one(conn, m_version, name, func):
+            print(f"Migration {m_version} ({name}) applied")
+            applied.append(m_version)
+    return applied
+
+
+_schema_ready = False
+
+
+class SchemaOutdated(RuntimeError):
+    """数据库版本落后且关闭了自动迁移"""
+
+
+def ensure_schema():
+    """启动时的快速检查：只读取一次版本号，落后时按 AUTO_MIGRATE 决定是否迁移
+
+    检查通过后在进程内缓存结果，后续请求不再访问数据库。
+    版本落后且 AUTO_MIGRATE=0 时抛出 SchemaOutdated，不标记为就绪，下一次请求重新检查。
+    """
+    global _schema_ready
+    if _schema_ready:
+        return True
+
+    with get_db() as conn:
+        if conn is None:
+            print("No database connection available, skipping schema check")
+            return False
+
+        version = current_version(conn)
+        if version < latest_version():
+            if AUTO_MIGRATE:
+                migrate(conn)
+            else:
+                raise SchemaOutdated(f"Database schema is at version {version}, expected {latest_version()}; "
+                                     f"run `python manage.py migrate`")
+
+    _schema_ready = True
+    return True
+
+
+def schema_ready():
+    """ensure_schema 是否已在本进程内检查通过"""
+    return _schema_ready
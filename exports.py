@@ -0,0 +1,112 @@
+"""财务导出：书籍、稿费、签约申请（CSV / NDJSON 流式输出）
+
+查询结果通过 db_hybrid.iter_query 逐批读取，每批编码后立即产出，
+导出任意行数时内存占用恒定，第一批数据读出后就开始向客户端发送。
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from db_hybrid import get_db, adapt_query, iter_query
+
+BATCH_SIZE = 2000
+
+# 名称 -> (不含 WHERE/ORDER BY 的 SELECT, 列名, 可用的筛选条件 {参数名: SQL 条件}, 排序列)
+EXPORTS = {
+    "books": (
+        """
+        SELECT b.id, b.title, b.pen_name, b.author_id, u.username, b.contract_type, b.buyout_amount, b.created_at
+        FROM books b LEFT JOIN users u ON b.author_id=u.id
+        """,
+        ["id", "title", "pen_name", "author_id", "author", "contract_type", "buyout_amount", "created_at"],
+        {"contract_type": "b.contract_type = ?"},
+        "b.id",
+    ),
+    "royalties": (
+        """
+        SELECT r.id, r.month, r.book_id, b.title, r.author_id, u.username, r.amount
+        FROM royalties r LEFT JOIN books b ON r.book_id=b.id LEFT JOIN users u ON r.author_id=u.id
+        """,
+        ["id", "month", "book_id", "title", "author_id", "author", "amount"],
+        {"month": "r.month = ?", "from": "r.month >= ?", "to": "r.month <= ?"},
+        "r.id",
+    ),
+    "applications": (
+        """
+        SELECT a.id, a.author_id, u.username, a.title, a.pen_name, a.contract_type, a.status,
+               a.reject_reason, a.created_at, a.processed_at, r.username
+        FROM applications a LEFT JOIN users u ON a.author_id=u.id LEFT JOIN users r ON a.reviewer_id=r.id
+        """,
+        ["id", "author_id", "author", "title", "pen_name", "contract_type", "status",
+         "reject_reason", "created_at", "processed_at", "reviewer"],
+        {"status": "a.status = ?"},
+        "a.id",
+    ),
+}
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+def build_query(name, filters):
+    """按导出名称和筛选参数生成 (sql, params)；未知的筛选参数被忽略"""
+    select_sql, _, allowed, order_column = EXPORTS[name]
+    conditions = []
+    params = []
+    for key, condition in allowed.items():
+        value = filters.get(key)
+        if value:
+            conditions.append(condition)
+            params.append(value)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return adapt_query(f"{select_sql}{where} ORDER BY {order_column}"), params
+
+
+def json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _encode_csv(columns, batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # 带BOM，Excel 打开时按UTF-8识别中文
+    buf.write("\ufeff")
+    writer.writerow(columns)
+    # 表头先发出去，客户端立即开始下载
+    yield buf.getvalue().encode("utf-8")
+    for rows in batches:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(tuple(row) for row in rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(columns, batches):
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=json_value) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+def stream(name, fmt, filters):
+    """返回导出内容的生成器（bytes）；连接在生成器结束或被关闭时归还"""
+    _, columns, _, _ = EXPORTS[name]
+    sql, params = build_query(name, filters)
+    encode = _encode_csv if fmt == "csv" else _encode_ndjson
+
+    def generate():
+        with get_db() as conn:
+            if conn is None:
+                return
+            yield from encode(columns, iter_query(conn, sql, params, BATCH_SIZE))
+
+    return generate()
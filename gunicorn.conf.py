@@ -0,0 +1,18 @@
+"""gunicorn 配置（gunicorn 启动时默认读取工作目录下的 gunicorn.conf.py）
+
+Procfile 等部署配置用 gevent worker 运行：SSE 长连接各是一个 greenlet，不占用线程。
+PostgreSQL 下 psycopg2 的网络等待默认不会让出，一条慢查询会卡住同一 worker 上的所有连接，
+因此在每个 worker fork 之后用 psycogreen 打补丁。
+"""
+
+
+def post_fork(server, worker):
+    if "gevent" not in server.cfg.worker_class_str:
+        return
+    try:
+        import psycopg2  # noqa: F401
+    except ImportError:
+        # 只使用 SQLite、没有安装 psycopg2 时不需要补丁
+        return
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
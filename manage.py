@@ -0,0 +1,240 @@
+"""命令行管理工具
+
+用法：
+    python manage.py migrate          # 应用所有未执行的数据库迁移（部署时执行）
+    python manage.py schema-status    # 查看已应用的迁移
+    python manage.py check-indexes    # 用 EXPLAIN 检查热点查询是否走索引
+    python manage.py rebuild-unread-counters  # 按 notifications 表重算未读计数
+    python manage.py archive-notifications --days 90  # 归档超过90天的已读通知（可由cron定时执行）
+    python manage.py rebuild-royalty-rollups  # 按 royalties 表重建稿费汇总
+    python manage.py build-assets     # 生成带指纹和预压缩的静态文件（修改 static/ 后执行）
+    python manage.py bench-compression  # 统计各页面压缩前后的大小与每次压缩的CPU耗时
+    python manage.py dispatch-outbox  # 常驻分发通知事件（加 --once 只分发当前积压后退出）
+    python manage.py outbox-status    # 查看待分发与已放弃的通知事件数
+    python manage.py slow-queries     # 按语句汇总慢查询日志，附最近一次的执行计划
+"""
+import argparse
+import json
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db_hybrid import get_db, transaction, verify_indexes
+import assets
+import db_migrations
+import notifications
+import outbox
+import royalty_rollups
+import slow_query
+
+
+def cmd_migrate(args):
+    applied = db_migrations.migrate()
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        print(f"Database schema is up to date (version {db_migrations.latest_version()})")
+    return 0
+
+
+def cmd_schema_status(args):
+    with get_db() as conn:
+        if conn is None:
+            print("No database connection available")
+            return 1
+        rows = db_migrations.applied_migrations(conn)
+        applied = {r[0] for r in rows}
+        for r in rows:
+            print(f"[x] {r[0]:>3}  {r[1]}  ({r[2]})")
+        for version, name, _ in db_migrations.MIGRATIONS:
+            if version not in applied:
+                print(f"[ ] {version:>3}  {name}")
+    return 0
+
+
+def cmd_check_indexes(args):
+    with get_db() as conn:
+        if conn is None:
+            print("No database connection available")
+            return 1
+        results = verify_indexes(conn)
+    failed = 0
+    for r in results:
+        mark = "OK  " if r["ok"] else "FAIL"
+        failed += not r["ok"]
+        print(f"{mark} {r['query']:<28} {r['index_used'] or '-':<30} {r['plan']}")
+    return 1 if failed else 0
+
+
+def cmd_rebuild_unread_counters(args):
+    with get_db() as conn:
+        if conn is None:
+            print("No database connection available")
+            return 1
+        with transaction(conn):
+            notifications.rebuild_counters(conn)
+    print("Unread counters rebuilt")
+    return 0
+
+
+def cmd_rebuild_royalty_rollups(args):
+    with get_db() as conn:
+        if conn is None:
+            print("No database connection available")
+            return 1
+        with transaction(conn):
+            royalty_rollups.rebuild(conn)
+    print("Royalty rollups rebuilt")
+    return 0
+
+
+def cmd_build_assets(args):
+    manifest = assets.build()
+    for name, entry in sorted(manifest.items()):
+        print(f"{name} -> {entry['file']}")
+    if assets.brotli is None:
+        print("brotli not installed, only .gz variants were generated")
+    return 0
+
+
+def cmd_bench_compression(args):
+    import time
+    import compression
+    from app import app
+
+    client = app.test_client()
+    if args.username:
+        client.post("/login", data={"username": args.username, "password": args.password})
+    levels = [int(level) for level in args.levels.split(",")]
+    print(f"{'path':<28}{'bytes':>9}" + "".join(f"{'L' + str(level):>10}{'ratio':>8}{'ms':>8}" for level in levels))
+    total = 0
+    saved = {level: 0 for level in levels}
+    for path in args.paths:
+        # 不带 Accept-Encoding，取未压缩的响应体
+        response = client.get(path)
+        if response.status_code != 200:
+            print(f"{path:<28} HTTP {response.status_code}, skipped")
+            continue
+        body = response.get_data()
+        total += len(body)
+        line = f"{path:<28}{len(body):>9}"
+        for level in levels:
+            started = time.process_time()
+            for _ in range(args.repeat):
+                compressed = compression.compress_bytes(body, level)
+            cpu_ms = (time.process_time() - started) / args.repeat * 1000
+            saved[level] += len(body) - len(compressed)
+            line += f"{len(compressed):>10}{len(compressed) / len(body):>8.2f}{cpu_ms:>8.2f}"
+        print(line)
+    for level in levels:
+        print(f"level {level}: saved {saved[level]} of {total} bytes")
+    return 0
+
+
+def cmd_archive_notifications(args):
+    result = notifications.archive_notifications(days=args.days, batch_size=args.batch_size, max_batches=args.max_batches)
+    if result is None:
+        return 1
+    print(f"Archived {result['rows_moved']} notifications read before {result['cutoff']} "
+          f"in {result['batches']} batches ({result['duration']}s)")
+    return 0
+
+
+def cmd_dispatch_outbox(args):
+    if args.once:
+        print(f"Dispatched {outbox.drain()} outbox events")
+        return 0
+    print(f"Dispatching outbox events every {outbox.POLL_INTERVAL}s (Ctrl+C to stop)")
+    try:
+        while True:
+            count = outbox.drain()
+            if count:
+                print(f"Dispatched {count} outbox events")
+            time.sleep(outbox.POLL_INTERVAL)
+    except KeyboardInterrupt:
+        return 0
+
+
+def cmd_outbox_status(args):
+    backlog = outbox.backlog()
+    if backlog is None:
+        print("No database connection available")
+        return 1
+    oldest = f"{backlog['oldest_age']}s" if backlog["oldest_age"] is not None else "-"
+    print(f"pending: {backlog['pending']}  dead: {backlog['dead']}  oldest pending: {oldest}")
+    print(f"sinks: {', '.join(outbox.OUTBOX_SINKS) or '(none)'}  dispatch mode: {outbox.OUTBOX_DISPATCH}")
+    return 0
+
+
+def cmd_slow_queries(args):
+    summary = {}
+    for entry in slow_query.read_log(args.path):
+        item = summary.setdefault(entry["statement"], {"count": 0, "total": 0.0, "max": 0.0, "plan": None, "endpoints": set()})
+        item["count"] += 1
+        item["total"] += entry["duration_ms"]
+        item["max"] = max(item["max"], entry["duration_ms"])
+        if entry.get("plan") is not None:
+            item["plan"] = entry["plan"]
+        if entry.get("endpoint"):
+            item["endpoints"].add(entry["endpoint"])
+    if not summary:
+        print("No slow queries logged")
+        return 0
+    ranked = sorted(summary.items(), key=lambda kv: kv[1]["total"], reverse=True)[:args.limit]
+    for statement, item in ranked:
+        print(f"{item['count']:>6} x  total {item['total']:.1f}ms  max {item['max']:.1f}ms  "
+              f"avg {item['total'] / item['count']:.1f}ms  [{', '.join(sorted(item['endpoints'])) or '-'}]")
+        print(f"        {statement}")
+        plan = item["plan"]
+        if isinstance(plan, list) and plan and isinstance(plan[0], str):
+            for line in plan:
+                print(f"          {line}")
+        elif plan is not None:
+            print(f"          {json.dumps(plan, ensure_ascii=False)[:500]}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QS3 管理工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("migrate", help="应用未执行的数据库迁移").set_defaults(func=cmd_migrate)
+    sub.add_parser("schema-status", help="查看迁移状态").set_defaults(func=cmd_schema_status)
+    sub.add_parser("check-indexes", help="检查热点查询的执行计划").set_defaults(func=cmd_check_indexes)
+    sub.add_parser("rebuild-unread-counters", help="重算未读通知计数").set_defaults(func=cmd_rebuild_unread_counters)
+    sub.add_parser("rebuild-royalty-rollups", help="重建稿费汇总表").set_defaults(func=cmd_rebuild_royalty_rollups)
+    sub.add_parser("build-assets", help="生成带指纹和预压缩的静态文件").set_defaults(func=cmd_build_assets)
+
+    bench = sub.add_parser("bench-compression", help="测量页面压缩率与CPU耗时")
+    bench.add_argument("paths", nargs="*", default=["/login", "/admin/management", "/admin/apps", "/admin/books", "/admin/users"])
+    bench.add_argument("--username", default="admin", help="先以该用户登录（为空则不登录）")
+    bench.add_argument("--password", default="admin123")
+    bench.add_argument("--levels", default="1,6,9", help="要比较的压缩级别，逗号分隔")
+    bench.add_argument("--repeat", type=int, default=50, help="每个级别重复压缩的次数")
+    bench.set_defaults(func=cmd_bench_compression)
+
+    archive = sub.add_parser("archive-notifications", help="归档过期的已读通知")
+    archive.add_argument("--days", type=int, default=None, help="保留天数（默认 NOTIFICATION_RETENTION_DAYS 或90）")
+    archive.add_argument("--batch-size", type=int, default=None, help="每批移动的行数")
+    archive.add_argument("--max-batches", type=int, default=None, help="本次最多执行的批数")
+    archive.set_defaults(func=cmd_archive_notifications)
+
+    dispatch = sub.add_parser("dispatch-outbox", help="分发通知事件")
+    dispatch.add_argument("--once", action="store_true", help="分发完当前积压后退出")
+    dispatch.set_defaults(func=cmd_dispatch_outbox)
+    sub.add_parser("outbox-status", help="查看通知事件积压").set_defaults(func=cmd_outbox_status)
+
+    slow = sub.add_parser("slow-queries", help="汇总慢查询日志")
+    slow.add_argument("--limit", type=int, default=20, help="按总耗时列出前几条语句")
+    slow.add_argument("--path", default=None, help="日志文件（默认 SLOW_QUERY_LOG）")
+    slow.set_defaults(func=cmd_slow_queries)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""延迟指标（Prometheus 文本格式，/metrics）
+
+记录的直方图：
+    http_request_duration_seconds   按 endpoint、method、status
+    db_query_duration_seconds       按归一化后的 SQL（字面量替换为 ?，IN 列表折叠）
+    db_connection_acquire_seconds   按 backend（postgres / sqlite）
+    template_render_seconds         按模板名
+
+多进程（gunicorn 多个 worker）部署时设置 METRICS_DIR：每个进程定期把自己的累计值写入
+METRICS_DIR/metrics-<pid>.json，/metrics 读取全部文件后按标签相加，无论请求落到哪个 worker
+结果都一样。已退出进程的文件保留（计数不会倒退），部署或重启前清空该目录。
+未设置时只输出当前进程的数据。
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# 不同 SQL 的种类上限，超过后归入 "other"，防止标签数量失控
+MAX_STATEMENTS = int(os.getenv("METRICS_MAX_STATEMENTS", "300"))
+MAX_STATEMENT_LENGTH = 300
+
+INF_LABEL = 'le="+Inf"'
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_registry = {}
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=BUCKETS, max_series=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.max_series = max_series
+        # 标签值元组 -> [各桶计数（不累加）..., 超出最大桶的计数, 总和]
+        self.series = {}
+        _registry[name] = self
+
+    def observe(self, value, *labels):
+        with _lock:
+            entry = self.series.get(labels)
+            if entry is None:
+                if self.max_series is not None and len(self.series) >= self.max_series:
+                    labels = ("other",) * len(self.labelnames)
+                    entry = self.series.get(labels)
+                if entry is None:
+                    entry = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            entry[index] += 1
+            entry[-1] += value
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request duration", ("endpoint", "method", "status"))
+QUERY_DURATION = Histogram("db_query_duration_seconds", "Database statement duration", ("statement",),
+                           max_series=MAX_STATEMENTS)
+CONNECTION_ACQUIRE = Histogram("db_connection_acquire_seconds", "Time to obtain a database connection", ("backend",))
+TEMPLATE_RENDER = Histogram("template_render_seconds", "Jinja template render time", ("template",))
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_statement(query):
+    """把 SQL 归一化为标签：压缩空白、字面量和占位符统一为 ?、IN/VALUES 列表折叠为 (...)"""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    sql = _SPACE.sub(" ", query).strip().replace("%s", "?")
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(...)", sql)
+    return sql[:MAX_STATEMENT_LENGTH]
+
+
+def observe_query(query, seconds):
+    QUERY_DURATION.observe(seconds, normalize_statement(query))
+
+
+# ---- 多进程汇总 ----
+
+_last_flush = 0.0
+
+
+def _snapshot():
+    with _lock:
+        return {
+            name: [[list(labels), list(entry)] for labels, entry in h.series.items()]
+            for name, h in _registry.items()
+        }
+
+
+def _path(pid):
+    return os.path.join(METRICS_DIR, f"metrics-{pid}.json")
+
+
+def flush():
+    """把当前进程的累计值写入 METRICS_DIR（先写临时文件再改名，读取方不会读到半个文件）"""
+    global _last_flush
+    if not METRICS_DIR:
+        return
+    _last_flush = time.monotonic()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _path(os.getpid())
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_snapshot(), f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def maybe_flush():
+    """每个请求结束时调用，距上次写入超过 FLUSH_INTERVAL 秒才真正写文件"""
+    if METRICS_DIR and time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        try:
+            flush()
+        except OSError as e:
+            print(f"Failed to write metrics: {e}")
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except OSError:
+        pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def _collect():
+    """合并各进程的数据：{指标名: {标签值元组: entry}}；当前进程使用内存中的最新值"""
+    merged = {name: {} for name in _registry}
+
+    def add(name, series):
+        target = merged.setdefault(name, {})
+        for labels, entry in series:
+            labels = tuple(labels)
+            current = target.get(labels)
+            target[labels] = list(entry) if current is None else [a + b for a, b in zip(current, entry)]
+
+    own = _path(os.getpid()) if METRICS_DIR else None
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        for filename in os.listdir(METRICS_DIR):
+            path = os.path.join(METRICS_DIR, filename)
+            if not filename.endswith(".json") or path == own:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, series in data.items():
+                add(name, series)
+    for name, series in _snapshot().items():
+        add(name, series)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render():
+    """生成 Prometheus 文本格式（text/plain; version=0.0.4）"""
+    lines = []
+    for name, series in _collect().items():
+        histogram = _registry.get(name)
+        if histogram is None:
+            continue
+        lines.append(f"# HELP {name} {histogram.documentation}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, entry in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, entry):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_format_labels(histogram.labelnames, labels, le)} {cumulative}")
+            cumulative += entry[len(histogram.buckets)]
+            lines.append(f"{name}_bucket{_format_labels(histogram.labelnames, labels, INF_LABEL)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(histogram.labelnames, labels)} {entry[-1]}")
+            lines.append(f"{name}_count{_format_labels(histogram.labelnames, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
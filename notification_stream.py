@@ -0,0 +1,251 @@
+"""站内通知实时推送（Server-Sent Events）
+
+每个进程一个 Hub：由一个后台线程发现新通知，再按收件人分发给已连接的订阅者；
+订阅者只在自己的队列上等待，连接再多也只有这一个线程查询数据库。
+发现新通知的方式：
+    PostgreSQL  专用连接 LISTEN notifications_changed（notifications 表上的语句级触发器发出），
+                收到后按 id 水位线查询新行；每 SSE_LISTEN_TIMEOUT 秒也会查询一次兜底
+    SQLite      按 id 水位线每 SSE_POLL_INTERVAL 秒轮询一次，只在有订阅者时轮询；
+                同一进程内 outbox 分发器写入通知后直接唤醒
+
+WSGI 下每个 SSE 连接占用一个 worker 线程；要在一个节点上保持成千上万个空闲连接，
+用 gevent worker 运行（见 README），此时每个连接只是一个 greenlet。
+"""
+import json
+import os
+import select
+import threading
+import time
+from collections import deque
+
+from db_hybrid import (
+    get_db, adapt_query, execute_query, execute_query_all, connect_dedicated,
+    POSTGRES_AVAILABLE, IS_VERCEL,
+)
+
+POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "1"))
+LISTEN_TIMEOUT = float(os.getenv("SSE_LISTEN_TIMEOUT", "15"))
+HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))
+# 连接保持的最长秒数，到期后由浏览器自动重连（Vercel 函数有执行时长上限）
+MAX_DURATION = float(os.getenv("SSE_MAX_DURATION", "25" if IS_VERCEL else "600"))
+MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "10000"))
+# 断线重连时补发的最多条数
+BACKFILL_LIMIT = 50
+BATCH_SIZE = 500
+RETRY_MS = 3000
+
+CHANNEL = "notifications_changed"
+
+_SELECT = """
+    SELECT n.id, n.recipient_id, n.message, n.created_at, COALESCE(c.unread, 0)
+    FROM notifications n LEFT JOIN notification_counters c ON c.user_id = n.recipient_id
+"""
+
+
+def _event(row):
+    return {"id": row[0], "message": row[2], "created_at": str(row[3]), "unread": max(row[4], 0)}
+
+
+def format_event(event):
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: notification\ndata: {data}\n\n"
+
+
+class Subscriber:
+    """一个 SSE 连接；Hub 线程放入事件，连接所在的线程 / greenlet 取出"""
+
+    def __init__(self, user_id, last_id):
+        self.user_id = user_id
+        self.last_id = last_id or 0
+        self._events = deque(maxlen=BATCH_SIZE)
+        self._ready = threading.Event()
+
+    def push(self, event):
+        self._events.append(event)
+        self._ready.set()
+
+    def wait(self, timeout):
+        """等待新事件，超时返回空列表；已发送过的 id（如补发过的）会被跳过"""
+        if self._ready.wait(timeout):
+            self._ready.clear()
+        events = []
+        while self._events:
+            event = self._events.popleft()
+            if event["id"] > self.last_id:
+                events.append(event)
+                self.last_id = event["id"]
+        return events
+
+
+class Hub:
+    def __init__(self):
+        self._subscribers = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._wakeup = threading.Event()
+        self._watermark = None
+        self._listen_conn = None
+        self._thread = None
+        self._thread_pid = None
+        self.stats = {"events": 0, "polls": 0, "rejected": 0, "errors": 0}
+
+    def subscribe(self, user_id, last_id=None):
+        """注册订阅者；超过 MAX_SUBSCRIBERS 时返回 None"""
+        with self._lock:
+            if self._count >= MAX_SUBSCRIBERS:
+                self.stats["rejected"] += 1
+                return None
+            subscriber = Subscriber(user_id, last_id)
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+            self._count += 1
+            self._active.set()
+        self._ensure_thread()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user_id)
+            if subscribers is None or subscriber not in subscribers:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.user_id]
+            self._count -= 1
+            if not self._count:
+                self._active.clear()
+
+    def wake(self):
+        """同一进程内写入通知后调用，SQLite 下不必等到下一次轮询"""
+        if self._count:
+            self._wakeup.set()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, subscribers=self._count, users=len(self._subscribers),
+                        watermark=self._watermark, listening=self._listen_conn is not None)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                # fork 出的 worker 不能沿用父进程的 LISTEN 连接
+                self._listen_conn = None
+                self._thread = threading.Thread(target=self._run, name="notification-hub", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            if not self._active.is_set():
+                self._active.wait()
+                # 空闲期间的通知不再推送，从当前最大 id 重新开始
+                self._watermark = None
+            try:
+                if self._watermark is None:
+                    self._watermark = self._current_max_id()
+                self._wait_for_change()
+                self._poll()
+            except Exception as e:
+                print(f"Notification hub error: {e}")
+                self.stats["errors"] += 1
+                self._close_listen_conn()
+                time.sleep(POLL_INTERVAL)
+
+    def _wait_for_change(self):
+        if POSTGRES_AVAILABLE and IS_VERCEL:
+            if self._listen_conn is None:
+                self._listen_conn = connect_dedicated()
+                if self._listen_conn is not None:
+                    with self._listen_conn.cursor() as cur:
+                        cur.execute(f"LISTEN {CHANNEL}")
+            if self._listen_conn is not None:
+                conn = self._listen_conn
+                if not conn.notifies:
+                    select.select([conn], [], [], LISTEN_TIMEOUT)
+                conn.poll()
+                conn.notifies.clear()
+                return
+        self._wakeup.wait(POLL_INTERVAL)
+        self._wakeup.clear()
+
+    def _close_listen_conn(self):
+        conn, self._listen_conn = self._listen_conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _current_max_id(self):
+        with get_db() as conn:
+            if conn is None:
+                raise RuntimeError("no database connection")
+            row = execute_query(conn, "SELECT MAX(id) FROM notifications")
+        return row[0] or 0
+
+    def _poll(self):
+        """查询水位线之后的新通知并分发；PostgreSQL 上序列号可能乱序提交，
+        极少数情况下晚提交的较小 id 不会被推送，但刷新页面时仍能看到"""
+        self.stats["polls"] += 1
+        while self._count:
+            with get_db() as conn:
+                if conn is None:
+                    return
+                rows = execute_query_all(conn, adapt_query(
+                    f"{_SELECT} WHERE n.id > ? ORDER BY n.id LIMIT {BATCH_SIZE}"
+                ), (self._watermark,))
+            if not rows:
+                return
+            self._watermark = rows[-1][0]
+            with self._lock:
+                targets = [(row, list(self._subscribers.get(row[1], ()))) for row in rows]
+            for row, subscribers in targets:
+                if subscribers:
+                    event = _event(row)
+                    for subscriber in subscribers:
+                        subscriber.push(event)
+                    self.stats["events"] += len(subscribers)
+            if len(rows) < BATCH_SIZE:
+                return
+
+
+hub = Hub()
+
+
+def backfill(user_id, last_id):
+    """断线重连时补发 last_id 之后的通知（最多 BACKFILL_LIMIT 条，按 id 升序）"""
+    with get_db() as conn:
+        if conn is None:
+            return []
+        rows = execute_query_all(conn, adapt_query(
+            f"{_SELECT} WHERE n.recipient_id = ? AND n.id > ? ORDER BY n.id DESC LIMIT {BACKFILL_LIMIT}"
+        ), (user_id, last_id))
+    return [_event(row) for row in reversed(rows)]
+
+
+def stream(subscriber, missed=()):
+    """生成 SSE 响应内容；连接断开或超过 MAX_DURATION 时结束并取消订阅"""
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for event in missed:
+            subscriber.last_id = max(subscriber.last_id, event["id"])
+            yield format_event(event)
+        deadline = time.monotonic() + MAX_DURATION
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = subscriber.wait(min(HEARTBEAT, remaining))
+            if events:
+                yield "".join(format_event(event) for event in events)
+            else:
+                # 注释行作为心跳，及时发现断开的连接，也防止代理因空闲关闭连接
+                yield ": ping\n\n"
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+def stats():
+    return hub.snapshot()
@@ -0,0 +1,146 @@
+"""站内通知与未读计数
+
+notification_counters 表按用户保存未读数，在写入通知和标记已读时同步维护；
+前面再加一层进程内 TTL 缓存，页面上的未读角标不需要查询 notifications 表。
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import change_stamps
+from db_hybrid import (
+    get_db, transaction, after_commit, adapt_query, in_clause,
+    execute_query, execute_query_all, execute_update, execute_many,
+)
+
+# 已读通知保留的天数，超过后由 archive_notifications 移入 notifications_archive
+RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("NOTIFICATION_ARCHIVE_BATCH_SIZE", "1000"))
+
+# 未读数缓存的有效期（秒）；本进程内的写操作提交后立即失效缓存，其他进程最多延迟一个TTL
+UNREAD_CACHE_TTL = float(os.getenv("UNREAD_CACHE_TTL", "30"))
+
+_INSERT_NOTIFICATION = "INSERT INTO notifications (recipient_id, message) VALUES (?, ?)"
+_INCREMENT_UNREAD = """
+    INSERT INTO notification_counters (user_id, unread) VALUES (?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET unread = notification_counters.unread + excluded.unread
+"""
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def add_notifications(conn, rows):
+    """批量写入通知 [(recipient_id, message)] 并累加未读数"""
+    if not rows:
+        return
+    execute_many(conn, adapt_query(_INSERT_NOTIFICATION), rows)
+    counts = {}
+    for recipient_id, _ in rows:
+        counts[recipient_id] = counts.get(recipient_id, 0) + 1
+    execute_many(conn, adapt_query(_INCREMENT_UNREAD), list(counts.items()))
+    after_commit(conn, lambda: invalidate_unread(counts))
+
+
+def mark_all_read(conn, user_id):
+    # 只更新未读的行，已读的历史通知不会被重复改写
+    execute_update(conn, adapt_query("UPDATE notifications SET is_read=TRUE WHERE recipient_id=? AND is_read=FALSE"), (user_id,))
+    execute_update(conn, adapt_query("UPDATE notification_counters SET unread=0 WHERE user_id=?"), (user_id,))
+    after_commit(conn, lambda: invalidate_unread([user_id]))
+
+
+def mark_one_read(conn, user_id, notification_id):
+    # 只有确实从未读变为已读时才减少计数
+    changed = execute_update(conn,
+        adapt_query("UPDATE notifications SET is_read=TRUE WHERE id=? AND recipient_id=? AND is_read=FALSE"),
+        (notification_id, user_id),
+    )
+    if changed:
+        execute_update(conn,
+            adapt_query("UPDATE notification_counters SET unread=unread-? WHERE user_id=? AND unread>0"),
+            (changed, user_id),
+        )
+    after_commit(conn, lambda: invalidate_unread([user_id]))
+
+
+def unread_count(user_id, version=None):
+    """返回用户的未读通知数（先查缓存，未命中时查 notification_counters 主键）
+
+    version 为页面 ETag 所用的 change_stamps 版本：缓存项按版本记录，版本不同即视为未命中，
+    带 ETag 的页面不会把其他进程写入前的旧角标固定在304响应里。
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry and entry[1] > now and (version is None or entry[2] == version):
+            return entry[0]
+    with get_db() as conn:
+        if conn is None:
+            return 0
+        row = execute_query(conn, adapt_query("SELECT unread FROM notification_counters WHERE user_id=?"), (user_id,))
+    count = max(row[0], 0) if row else 0
+    with _cache_lock:
+        _cache[user_id] = (count, now + UNREAD_CACHE_TTL, version)
+    return count
+
+
+def invalidate_unread(user_ids):
+    with _cache_lock:
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+def clear_unread_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def rebuild_counters(conn):
+    """根据 notifications 表重算所有用户的未读数（由调用方提交）"""
+    execute_update(conn, "DELETE FROM notification_counters")
+    execute_update(conn, """
+        INSERT INTO notification_counters (user_id, unread)
+        SELECT recipient_id, COUNT(*) FROM notifications WHERE is_read = FALSE GROUP BY recipient_id
+    """)
+    after_commit(conn, clear_unread_cache)
+
+
+def archive_notifications(days=None, batch_size=None, max_batches=None):
+    """把超过 days 天的已读通知分批移入 notifications_archive
+
+    每批在一个短事务中完成 INSERT ... SELECT 与 DELETE，避免长时间持有写锁。
+    返回本次运行的指标 {"cutoff", "rows_moved", "batches", "duration"}。
+    """
+    days = RETENTION_DAYS if days is None else days
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    # created_at 以 UTC 的 'YYYY-MM-DD HH:MM:SS' 存储，两种数据库都可直接按字符串比较
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    started = time.monotonic()
+    moved = 0
+    batches = 0
+
+    with get_db() as conn:
+        if conn is None:
+            print("No database connection available, skipping archive")
+            return None
+        while max_batches is None or batches < max_batches:
+            with transaction(conn):
+                rows = execute_query_all(conn,
+                    adapt_query(f"SELECT id, recipient_id FROM notifications WHERE is_read = TRUE AND created_at < ? ORDER BY id LIMIT {int(batch_size)}"),
+                    (cutoff,),
+                )
+                if not rows:
+                    break
+                ids_sql, ids_params = in_clause("id", [r[0] for r in rows])
+                execute_update(conn, adapt_query(f"""
+                    INSERT INTO notifications_archive (id, recipient_id, message, created_at, is_read)
+                    SELECT id, recipient_id, message, created_at, is_read FROM notifications WHERE {ids_sql}
+                """), ids_params)
+                execute_update(conn, adapt_query(f"DELETE FROM notifications WHERE {ids_sql}"), ids_params)
+                change_stamps.bump(conn, [change_stamps.user_scope(r[1]) for r in rows])
+            moved += len(rows)
+            batches += 1
+
+    duration = time.monotonic() - started
+    return {"cutoff": cutoff, "rows_moved": moved, "batches": batches, "duration": round(duration, 3)}
@@ -0,0 +1,336 @@
+"""事务性发件箱（outbox）与后台分发
+
+业务写操作在自己的事务里调用 statements / enqueue 写入 outbox 表，只保存事件类型、收件人和参数；
+分发器按批读取到期的事件：
+1. 在一个事务中生成通知文案、写入 notifications 并累加未读数，记录 notified_at；
+2. 依次交给 OUTBOX_SINKS 中配置的外部出口（file / smtp），全部成功后记录 dispatched_at，
+   失败时按指数退避重试，超过 OUTBOX_MAX_ATTEMPTS 次后不再重试（last_error 保留原因）。
+外部出口是“至少一次”投递，事件带 id，可据此去重。
+
+分发方式由 OUTBOX_DISPATCH 决定：
+    thread  每个进程一个后台线程（默认；写入后立即唤醒）
+    inline  写入提交后在当前请求中分发刚到期的事件（Vercel 等无常驻线程的环境）
+    off     只由 `python manage.py dispatch-outbox` 或 /cron/outbox 分发
+"""
+import json
+import os
+import random
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+from db_hybrid import (
+    get_db, transaction, adapt_query, in_clause,
+    execute_query, execute_query_all, execute_update, execute_many,
+    POSTGRES_AVAILABLE, IS_VERCEL,
+)
+import change_stamps
+import notification_stream
+import notifications
+import view_cache
+
+OUTBOX_DISPATCH = os.getenv("OUTBOX_DISPATCH", "inline" if IS_VERCEL else "thread")
+OUTBOX_SINKS = [s.strip() for s in os.getenv("OUTBOX_SINKS", "").split(",") if s.strip()]
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "5"))
+RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "600"))
+# 认领一批事件后，这段时间内其他分发器不会再取到它们
+LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+
+_INSERT = "INSERT INTO outbox (event_type, recipient_id, payload, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?)"
+
+
+# ---- 事件与通知文案 ----
+
+def _approved(p):
+    if p["contract_type"] == "买断":
+        return f"您的签约申请已通过（买断），《{p['title']}》买断稿费：¥{p['buyout_amount']}"
+    return f"您的签约申请已通过（保底），《{p['title']}》后续按月设置稿费"
+
+
+MESSAGES = {
+    "application_approved": _approved,
+    "application_rejected": lambda p: f"您的签约申请被拒绝：《{p['title']}》，原因：{p['reason']}",
+    "royalty_set": lambda p: f"已设置《{p['title']}》 {p['month']} 稿费：¥{p['amount']:.2f}",
+}
+
+
+def render_message(event_type, payload):
+    return MESSAGES[event_type](payload)
+
+
+def statements(events):
+    """写入事件的语句 [(query, params)]，供调用方并入 execute_batch；events 为 [(事件类型, 收件人, 参数)]"""
+    now = time.time()
+    return [
+        (adapt_query(_INSERT), (event_type, recipient_id, json.dumps(payload, ensure_ascii=False), now, now))
+        for event_type, recipient_id, payload in events
+    ]
+
+
+def enqueue(conn, events):
+    """批量写入事件（由调用方在业务事务中调用）"""
+    rows = [params for _, params in statements(events)]
+    if rows:
+        execute_many(conn, adapt_query(_INSERT), rows)
+
+
+# ---- 外部出口 ----
+
+class FileSink:
+    """把事件逐行追加到 JSON Lines 文件，用于本地调试或由其他程序消费"""
+
+    def __init__(self):
+        self.path = os.getenv("OUTBOX_FILE_PATH") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "outbox_events.log"
+        )
+        self._lock = threading.Lock()
+
+    def send(self, event):
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class SMTPSink:
+    """通过 SMTP 发送邮件；本地可用 `python -m aiosmtpd -n -l localhost:1025` 作为调试服务器"""
+
+    def __init__(self):
+        self.host = os.getenv("OUTBOX_SMTP_HOST", "localhost")
+        self.port = int(os.getenv("OUTBOX_SMTP_PORT", "1025"))
+        self.sender = os.getenv("OUTBOX_SMTP_FROM", "noreply@localhost")
+        # 用户表没有邮箱，收件地址按 user-<id>@域名 生成
+        self.domain = os.getenv("OUTBOX_SMTP_DOMAIN", "localhost")
+
+    def send(self, event):
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = f"user-{event['recipient_id']}@{self.domain}"
+        msg["Subject"] = "站内通知"
+        msg["Message-ID"] = f"<outbox-{event['id']}@{self.domain}>"
+        msg.set_content(event["message"])
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(msg)
+
+
+SINK_TYPES = {
+    "file": FileSink,
+    "smtp": SMTPSink,
+}
+
+_sinks = None
+
+
+def register_sink(name, factory):
+    """注册自定义出口：factory() 返回带 send(event) 方法的对象"""
+    global _sinks
+    SINK_TYPES[name] = factory
+    _sinks = None
+
+
+def get_sinks():
+    global _sinks
+    if _sinks is None:
+        _sinks = [(name, SINK_TYPES[name]()) for name in OUTBOX_SINKS]
+    return _sinks
+
+
+# ---- 分发 ----
+
+stats = {
+    "dispatched": 0,
+    "notified": 0,
+    "failures": 0,
+    "batches": 0,
+    "last_batch_at": None,
+    "last_batch_seconds": 0.0,
+    # 事件写入到写入 notifications 的延迟（秒）
+    "last_lag": None,
+    "max_lag": 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def backoff(attempts):
+    """第 attempts 次失败后的等待秒数：指数增长、有上限、带 ±10% 抖动"""
+    delay = min(RETRY_MAX, RETRY_BASE * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.9, 1.1)
+
+
+def _claim(conn, now, batch_size):
+    lock = " FOR UPDATE SKIP LOCKED" if POSTGRES_AVAILABLE and IS_VERCEL else ""
+    rows = execute_query_all(conn, adapt_query(f"""
+        SELECT id, event_type, recipient_id, payload, created_at, attempts, notified_at FROM outbox
+        WHERE dispatched_at IS NULL AND attempts < ? AND next_attempt_at <= ?
+        ORDER BY id LIMIT {int(batch_size)}{lock}
+    """), (MAX_ATTEMPTS, now))
+    if rows:
+        ids_sql, ids_params = in_clause("id", [r[0] for r in rows])
+        execute_update(conn, adapt_query(f"UPDATE outbox SET next_attempt_at=? WHERE {ids_sql}"),
+                       [now + LEASE_SECONDS] + ids_params)
+    return rows
+
+
+def _has_due(conn, now):
+    """只读检查是否有到期的事件（走 idx_outbox_pending 部分索引），空闲时不必开启写事务"""
+    return execute_query(conn, adapt_query("""
+        SELECT 1 FROM outbox WHERE dispatched_at IS NULL AND attempts < ? AND next_attempt_at <= ? LIMIT 1
+    """), (MAX_ATTEMPTS, now)) is not None
+
+
+def dispatch_batch(batch_size=None):
+    """分发一批到期的事件，返回处理的事件数"""
+    started = time.monotonic()
+    now = time.time()
+    sinks = get_sinks()
+    with get_db() as conn:
+        if conn is None:
+            return 0
+        # SQLite 的 transaction() 以 BEGIN IMMEDIATE 取写锁，空队列时先用只读查询返回
+        if not _has_due(conn, now):
+            return 0
+        with transaction(conn):
+            rows = _claim(conn, now, batch_size or BATCH_SIZE)
+            if not rows:
+                return 0
+            events = []
+            fresh = []
+            for event_id, event_type, recipient_id, payload, created_at, attempts, notified_at in rows:
+                try:
+                    payload = json.loads(payload)
+                    message = render_message(event_type, payload)
+                except Exception as e:
+                    # 无法解析的事件直接放弃，避免整批反复失败
+                    print(f"Outbox event {event_id} is malformed: {e}")
+                    execute_update(conn, adapt_query("UPDATE outbox SET attempts=?, last_error=? WHERE id=?"),
+                                   (MAX_ATTEMPTS, f"malformed: {e}"[:500], event_id))
+                    continue
+                event = {"id": event_id, "type": event_type, "recipient_id": recipient_id,
+                         "payload": payload, "created_at": created_at, "attempts": attempts,
+                         "message": message}
+                events.append(event)
+                if notified_at is None:
+                    fresh.append(event)
+            if fresh:
+                notifications.add_notifications(conn, [(e["recipient_id"], e["message"]) for e in fresh])
+                change_stamps.bump(conn, [change_stamps.user_scope(e["recipient_id"]) for e in fresh])
+                ids_sql, ids_params = in_clause("id", [e["id"] for e in fresh])
+                execute_update(conn, adapt_query(f"UPDATE outbox SET notified_at=? WHERE {ids_sql}"), [now] + ids_params)
+            if events and not sinks:
+                ids_sql, ids_params = in_clause("id", [e["id"] for e in events])
+                execute_update(conn, adapt_query(f"UPDATE outbox SET dispatched_at=? WHERE {ids_sql}"), [now] + ids_params)
+        if fresh:
+            view_cache.invalidate_user({e["recipient_id"] for e in fresh}, {"author_notifications"})
+            notification_stream.hub.wake()
+
+        failed = 0
+        if sinks:
+            delivered = []
+            for event in events:
+                try:
+                    for _, sink in sinks:
+                        sink.send(event)
+                except Exception as e:
+                    failed += 1
+                    attempts = event["attempts"] + 1
+                    print(f"Outbox event {event['id']} delivery failed (attempt {attempts}): {e}")
+                    execute_update(conn, adapt_query(
+                        "UPDATE outbox SET attempts=?, next_attempt_at=?, last_error=? WHERE id=?"
+                    ), (attempts, time.time() + backoff(attempts), str(e)[:500], event["id"]))
+                else:
+                    delivered.append(event["id"])
+            if delivered:
+                ids_sql, ids_params = in_clause("id", delivered)
+                execute_update(conn, adapt_query(f"UPDATE outbox SET dispatched_at=? WHERE {ids_sql}"), [time.time()] + ids_params)
+
+    lags = [now - e["created_at"] for e in fresh]
+    with _stats_lock:
+        stats["dispatched"] += len(events) - failed
+        stats["notified"] += len(fresh)
+        stats["failures"] += failed
+        stats["batches"] += 1
+        stats["last_batch_at"] = now
+        stats["last_batch_seconds"] = round(time.monotonic() - started, 4)
+        if lags:
+            stats["last_lag"] = round(max(lags), 3)
+            stats["max_lag"] = round(max(stats["max_lag"], max(lags)), 3)
+    return len(events)
+
+
+def drain(max_batches=None):
+    """连续分发直到没有到期事件，返回处理的事件总数"""
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        count = dispatch_batch()
+        if not count:
+            break
+        total += count
+        batches += 1
+    return total
+
+
+def backlog():
+    """数据库中的积压情况：待分发数、已放弃数、最早待分发事件的等待秒数"""
+    with get_db() as conn:
+        if conn is None:
+            return None
+        row = execute_query(conn, adapt_query(
+            "SELECT COUNT(*), MIN(created_at) FROM outbox WHERE dispatched_at IS NULL AND attempts < ?"
+        ), (MAX_ATTEMPTS,))
+        dead = execute_query(conn, adapt_query(
+            "SELECT COUNT(*) FROM outbox WHERE dispatched_at IS NULL AND attempts >= ?"
+        ), (MAX_ATTEMPTS,))
+    return {
+        "pending": row[0],
+        "dead": dead[0],
+        "oldest_age": round(time.time() - row[1], 3) if row[1] is not None else None,
+    }
+
+
+# ---- 后台线程 ----
+
+_wakeup = threading.Event()
+_thread = None
+_thread_pid = None
+_thread_lock = threading.Lock()
+
+
+def _run():
+    while True:
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+        try:
+            drain()
+        except Exception as e:
+            print(f"Outbox dispatcher error: {e}")
+
+
+def ensure_dispatcher():
+    """thread 模式下确保当前进程的分发线程在运行（fork 后重新启动）"""
+    global _thread, _thread_pid
+    if OUTBOX_DISPATCH != "thread":
+        return
+    if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+        return
+    with _thread_lock:
+        if _thread is None or _thread_pid != os.getpid() or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="outbox-dispatcher", daemon=True)
+            _thread_pid = os.getpid()
+            _thread.start()
+
+
+def kick():
+    """业务事务提交后调用：唤醒分发线程，或在 inline 模式下立即分发"""
+    if OUTBOX_DISPATCH == "thread":
+        ensure_dispatcher()
+        _wakeup.set()
+    elif OUTBOX_DISPATCH == "inline":
+        try:
+            drain(max_batches=1)
+        except Exception as e:
+            # 事件已经落库，失败时留给下一次分发
+            print(f"Inline outbox dispatch failed: {e}")
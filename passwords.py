@@ -0,0 +1,92 @@
+"""密码哈希策略
+
+哈希算法与成本参数由 PASSWORD_HASH_METHOD 配置（Werkzeug 格式，如 scrypt:32768:8:1、pbkdf2:sha256:600000）。
+校验放在有界线程池里执行：hashlib 的 scrypt / pbkdf2 计算期间释放 GIL，多线程 worker 中
+其他请求可以继续处理；同时进行的校验数量有上限，登录高峰时多余的请求快速失败，而不是占满CPU。
+gevent worker 对 threading 打过补丁，普通线程池里的"线程"只是 greenlet，计算期间会卡住整个 worker
+（包括所有 SSE 连接），此时改用 gevent 提供的原生线程池。
+登录成功且库中哈希的参数或盐长度与当前策略不同时，由调用方用 hash_password 重新生成并保存。
+"""
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+PASSWORD_SALT_LENGTH = int(os.getenv("PASSWORD_SALT_LENGTH", "16"))
+
+# 同时执行校验的线程数，以及包括排队在内的最大校验数
+VERIFY_WORKERS = int(os.getenv("PASSWORD_VERIFY_WORKERS", "2"))
+VERIFY_MAX_PENDING = int(os.getenv("PASSWORD_VERIFY_MAX_PENDING", str(VERIFY_WORKERS * 4)))
+VERIFY_TIMEOUT = float(os.getenv("PASSWORD_VERIFY_TIMEOUT", "10"))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(VERIFY_MAX_PENDING)
+
+
+class PasswordCheckBusy(Exception):
+    """校验队列已满或等待超时"""
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH)
+
+
+@lru_cache(maxsize=None)
+def current_method():
+    """当前策略展开后的完整参数（如 scrypt 展开为 scrypt:32768:8:1），与库中哈希的前缀比较"""
+    return hash_password("").split("$", 1)[0]
+
+
+def needs_rehash(stored_hash):
+    parts = stored_hash.split("$", 2)
+    if len(parts) != 3:
+        return True
+    method, salt, _ = parts
+    return method != current_method() or len(salt) != PASSWORD_SALT_LENGTH
+
+
+def _executor_class():
+    """gevent 的 monkey patch 生效时使用原生线程执行的 gevent.threadpool.ThreadPoolExecutor"""
+    if "gevent" in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched("threading"):
+            from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+            return NativeThreadPoolExecutor
+    return ThreadPoolExecutor
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    # fork 出的 worker 里不能复用父进程的线程池
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = _executor_class()(max_workers=VERIFY_WORKERS, thread_name_prefix="pwcheck")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def verify_password(stored_hash, password):
+    """在线程池中校验密码；排队已满或超过 VERIFY_TIMEOUT 秒时抛出 PasswordCheckBusy"""
+    if not _slots.acquire(blocking=False):
+        raise PasswordCheckBusy("too many concurrent password checks")
+    try:
+        future = _get_executor().submit(check_password_hash, stored_hash, password)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=VERIFY_TIMEOUT)
+    except FutureTimeout:
+        # gevent 的 Future 不支持取消，超时后让它在后台算完
+        cancel = getattr(future, "cancel", None)
+        if cancel is not None:
+            cancel()
+        raise PasswordCheckBusy("password check timed out")
@@ -0,0 +1,167 @@
+"""登录与密钥校验的限流（滑动窗口）
+
+规则用 "次数/秒数" 配置，例如 LOGIN_IP_LIMIT=20/300 表示同一IP 300 秒内最多 20 次登录尝试。
+记录的是每次尝试的时间戳（滑动日志），窗口内次数达到上限时拒绝，直到最早一次移出窗口。
+
+后端由 RATELIMIT_BACKEND 选择：
+    memory  进程内字典，适合单进程部署
+    sqlite  共享的 SQLite 文件（RATELIMIT_SQLITE_PATH），同一台机器上的多个 gunicorn worker 共用计数
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+RATELIMIT_BACKEND = os.getenv("RATELIMIT_BACKEND", "memory")
+RATELIMIT_SQLITE_PATH = os.getenv("RATELIMIT_SQLITE_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "ratelimit.sqlite3"
+)
+# 部署在反向代理之后时，用 X-Forwarded-For 中的客户端地址；
+# Vercel、Render、Railway、Heroku 的平台环境变量存在时默认开启，否则所有请求都来自代理的同一个地址
+_PROXIED = any(os.getenv(name) for name in ("VERCEL", "RENDER", "RAILWAY_ENVIRONMENT", "DYNO"))
+TRUST_FORWARDED = os.getenv("RATELIMIT_TRUST_FORWARDED", "1" if _PROXIED else "0") == "1"
+# 客户端与应用之间的可信代理层数：从 X-Forwarded-For 右侧数第几个地址是客户端，
+# 左侧的地址可由客户端任意伪造，不能使用
+PROXY_HOPS = max(int(os.getenv("RATELIMIT_PROXY_HOPS", "1")), 1)
+
+
+class MemoryBackend:
+    """进程内滑动日志；空闲的键在清理时移除，键数量有上限"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._hits = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def count(self, key, window, now):
+        """返回 (窗口内次数, 最早一次的时间)"""
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0, None
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            return len(hits), (hits[0] if hits else None)
+
+    def add(self, key, window, now):
+        with self._lock:
+            self._hits.setdefault(key, deque()).append(now)
+            if len(self._hits) > self.max_keys or now - self._last_sweep > window:
+                self._sweep(window, now)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def _sweep(self, window, now):
+        self._last_sweep = now
+        for key in [k for k, hits in self._hits.items() if not hits or hits[-1] <= now - window]:
+            del self._hits[key]
+        # 仍然超过上限时丢弃最久没有活动的键
+        if len(self._hits) > self.max_keys:
+            for key in sorted(self._hits, key=lambda k: self._hits[k][-1])[:len(self._hits) - self.max_keys]:
+                del self._hits[key]
+
+
+class SQLiteBackend:
+    """共享 SQLite 文件中的滑动日志，每个线程一个连接"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_sweep = 0.0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS hits (key TEXT NOT NULL, ts REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_hits_key_ts ON hits(key, ts)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def count(self, key, window, now):
+        row = self._conn().execute(
+            "SELECT COUNT(*), MIN(ts) FROM hits WHERE key=? AND ts>?", (key, now - window)
+        ).fetchone()
+        return row[0], row[1]
+
+    def add(self, key, window, now):
+        conn = self._conn()
+        conn.execute("INSERT INTO hits (key, ts) VALUES (?, ?)", (key, now))
+        if now - self._last_sweep > window:
+            self._last_sweep = now
+            conn.execute("DELETE FROM hits WHERE ts<=?", (now - window,))
+
+    def reset(self, key):
+        self._conn().execute("DELETE FROM hits WHERE key=?", (key,))
+
+
+class Rule:
+    def __init__(self, name, spec):
+        limit, window = spec.split("/", 1)
+        self.name = name
+        self.limit = int(limit)
+        self.window = float(window)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# 规则名 -> 被拒绝的次数
+throttled = {}
+_throttled_lock = threading.Lock()
+
+LOGIN_IP = Rule("login_ip", os.getenv("LOGIN_IP_LIMIT", "20/300"))
+LOGIN_USER = Rule("login_user", os.getenv("LOGIN_USER_LIMIT", "5/300"))
+ADMIN_KEY_IP = Rule("admin_key_ip", os.getenv("ADMIN_KEY_LIMIT", "5/600"))
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = SQLiteBackend(RATELIMIT_SQLITE_PATH) if RATELIMIT_BACKEND == "sqlite" else MemoryBackend()
+    return _backend
+
+
+def _key(rule, ident):
+    return f"{rule.name}:{ident}"
+
+
+def retry_after(rule, ident):
+    """已达上限时返回需要等待的秒数（向上取整），否则返回0；被拒绝时计数"""
+    now = time.time()
+    count, oldest = get_backend().count(_key(rule, ident), rule.window, now)
+    if count < rule.limit:
+        return 0
+    with _throttled_lock:
+        throttled[rule.name] = throttled.get(rule.name, 0) + 1
+    return max(1, int(oldest + rule.window - now + 0.999)) if oldest is not None else int(rule.window)
+
+
+def hit(rule, ident):
+    """记录一次尝试"""
+    get_backend().add(_key(rule, ident), rule.window, time.time())
+
+
+def reset(rule, ident):
+    get_backend().reset(_key(rule, ident))
+
+
+def client_ip(request):
+    route = request.access_route
+    if TRUST_FORWARDED and route:
+        return route[-PROXY_HOPS] if len(route) >= PROXY_HOPS else route[0]
+    return request.remote_addr or "unknown"
+
+
+def stats():
+    with _throttled_lock:
+        return {"backend": RATELIMIT_BACKEND, "throttled": dict(throttled)}
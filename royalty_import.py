@@ -0,0 +1,176 @@
+"""按月批量导入保底稿费（CSV / JSON）
+
+所有行先整体校验，再在一个事务里批量 upsert 稿费并批量写入通知。
+"""
+import csv
+import io
+import math
+import os
+from datetime import datetime
+
+from db_hybrid import transaction, adapt_query, in_clause, execute_query_all, execute_values
+import outbox
+import change_stamps
+import royalty_rollups
+import view_cache
+
+# 单次导入的最大行数
+MAX_ROWS = int(os.getenv("ROYALTY_IMPORT_MAX_ROWS", "20000"))
+
+# IN (...) 查询每批的参数个数，低于SQLite的参数上限
+_CHUNK = 500
+
+
+class RoyaltyImportError(ValueError):
+    """整个上传无法解析（格式错误、超过行数上限等）"""
+
+
+def parse_csv(data):
+    """解析CSV（需要表头 book_id,amount，可选 month），返回 [(行号, dict)]"""
+    if isinstance(data, bytes):
+        try:
+            # 兼容Excel导出的带BOM的UTF-8
+            data = data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise RoyaltyImportError("文件编码应为 UTF-8")
+    reader = csv.DictReader(io.StringIO(data))
+    if not reader.fieldnames or not {"book_id", "amount"} <= {f.strip() for f in reader.fieldnames}:
+        raise RoyaltyImportError("CSV 需要包含表头 book_id,amount（可选 month）")
+    rows = []
+    for record in reader:
+        if len(rows) >= MAX_ROWS:
+            raise RoyaltyImportError(f"单次最多导入 {MAX_ROWS} 行")
+        # 表头行是第1行
+        rows.append((reader.line_num, {(k or "").strip(): (v or "").strip() for k, v in record.items()}))
+    return rows
+
+
+def parse_json(payload):
+    """解析JSON：{"month": "...", "rows": [...]} 或直接是行列表"""
+    if isinstance(payload, dict):
+        items = payload.get("rows")
+    else:
+        items = payload
+    if not isinstance(items, list):
+        raise RoyaltyImportError("JSON 需要是行列表，或包含 rows 列表的对象")
+    if len(items) > MAX_ROWS:
+        raise RoyaltyImportError(f"单次最多导入 {MAX_ROWS} 行")
+    rows = []
+    for i, item in enumerate(items, start=1):
+        rows.append((i, item if isinstance(item, dict) else {}))
+    return rows
+
+
+def _fetch_books(conn, book_ids):
+    """分批按id查询书籍，返回 {id: (author_id, title, contract_type)}"""
+    books = {}
+    ids = sorted(book_ids)
+    for start in range(0, len(ids), _CHUNK):
+        ids_sql, params = in_clause("id", ids[start:start + _CHUNK])
+        result = execute_query_all(conn, adapt_query(
+            f"SELECT id, author_id, title, contract_type FROM books WHERE {ids_sql}"
+        ), params)
+        for r in result:
+            books[r[0]] = (r[1], r[2], r[3])
+    return books
+
+
+def validate(conn, rows, default_month):
+    """校验所有行，返回 (结果列表, 可写入的行)
+
+    结果列表中每行为 {"line", "book_id", "month", "amount", "status", "error"}；
+    可写入的行为 (结果下标, book_id, month, amount, author_id, title)。
+    """
+    results = []
+    parsed = []
+    for line, record in rows:
+        result = {"line": line, "book_id": record.get("book_id"), "month": None,
+                  "amount": record.get("amount"), "status": "error", "error": None}
+        results.append(result)
+
+        try:
+            book_id = int(record.get("book_id"))
+        except (TypeError, ValueError):
+            result["error"] = "book_id 无效"
+            continue
+        try:
+            amount = float(record.get("amount"))
+        except (TypeError, ValueError):
+            result["error"] = "金额无效"
+            continue
+        if math.isnan(amount) or math.isinf(amount) or amount < 0:
+            result["error"] = "金额无效"
+            continue
+        month = str(record.get("month") or default_month or "").strip()
+        try:
+            datetime.strptime(month, "%Y-%m")
+        except ValueError:
+            result["error"] = "月份格式应为 YYYY-MM"
+            continue
+
+        result.update(book_id=book_id, amount=amount, month=month)
+        parsed.append((len(results) - 1, book_id, month, amount))
+
+    books = _fetch_books(conn, {p[1] for p in parsed})
+    seen = {}
+    valid = []
+    for idx, book_id, month, amount in parsed:
+        result = results[idx]
+        book = books.get(book_id)
+        if book is None:
+            result["error"] = "书籍不存在"
+            continue
+        if book[2] != "保底":
+            result["error"] = "仅保底合同需要设置月度稿费"
+            continue
+        if (book_id, month) in seen:
+            result["error"] = f"与第 {seen[(book_id, month)]} 行重复"
+            continue
+        seen[(book_id, month)] = result["line"]
+        result["status"] = "ok"
+        valid.append((idx, book_id, month, amount, book[0], book[1]))
+    return results, valid
+
+
+def write(conn, valid):
+    """在一个事务中批量 upsert 稿费、重算汇总并写入通知事件（由 outbox 分发）"""
+    royalties = [(author_id, month, amount, book_id) for _, book_id, month, amount, author_id, _ in valid]
+    events = [("royalty_set", author_id, {"title": title, "month": month, "amount": amount})
+              for _, book_id, month, amount, author_id, title in valid]
+    if not royalties:
+        return
+
+    with transaction(conn):
+        # PostgreSQL 下多行拼成一条 INSERT ... VALUES (...),(...)，每页一次往返
+        execute_values(conn, """
+            INSERT INTO royalties (author_id, month, amount, book_id) VALUES {values}
+            ON CONFLICT (book_id, month) DO UPDATE SET amount = excluded.amount
+        """, royalties)
+        royalty_rollups.refresh(conn, [(author_id, book_id, month) for _, book_id, month, _, author_id, _ in valid])
+        outbox.enqueue(conn, events)
+        change_stamps.bump(conn, [change_stamps.user_scope(author_id) for _, author_id, _ in events])
+    view_cache.invalidate_user({author_id for _, author_id, _ in events})
+    outbox.kick()
+
+
+def import_rows(conn, rows, default_month, skip_invalid=False):
+    """校验并导入，返回报告
+
+    默认只要有一行校验失败就整体不写入；skip_invalid=True 时只导入校验通过的行。
+    """
+    results, valid = validate(conn, rows, default_month)
+    failed = len(results) - len(valid)
+    imported = 0
+    if valid and (skip_invalid or failed == 0):
+        write(conn, valid)
+        imported = len(valid)
+    else:
+        # 未写入的行标记为跳过，便于在报告里区分
+        for idx, *_ in valid:
+            results[idx]["status"] = "skipped"
+    return {
+        "total": len(results),
+        "imported": imported,
+        "failed": failed,
+        "rows": results,
+    }
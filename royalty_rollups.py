@@ -0,0 +1,91 @@
+"""保底稿费汇总表
+
+royalty_author_months：每个作者每月的稿费合计与书籍数
+royalty_book_totals：每本书的累计稿费、月份数与最近月份
+royalty_month_totals：每月全站的稿费合计、书籍数与作者数
+
+写 royalties 的事务里调用 refresh_statements / refresh，只重算受影响的键；
+汇总与明细不一致时可执行 `python manage.py rebuild-royalty-rollups`。
+"""
+from db_hybrid import adapt_query, in_clause, execute_batch, execute_update
+
+# IN (...) 每批的参数个数，低于SQLite的参数上限
+_CHUNK = 500
+
+
+def _chunks(values):
+    values = sorted(values)
+    for start in range(0, len(values), _CHUNK):
+        yield values[start:start + _CHUNK]
+
+
+def refresh_statements(keys):
+    """返回重算汇总的语句 [(query, params)]，供调用方并入 execute_batch
+
+    keys 为受影响的 (author_id, book_id, month)；需在 royalties 写入之后、同一事务内执行。
+    """
+    authors_by_month = {}
+    book_ids = set()
+    for author_id, book_id, month in keys:
+        authors_by_month.setdefault(month, set()).add(author_id)
+        if book_id is not None:
+            book_ids.add(book_id)
+
+    statements = []
+    for month, author_ids in sorted(authors_by_month.items()):
+        for chunk in _chunks(author_ids):
+            authors_sql, authors_params = in_clause("author_id", chunk)
+            statements.append((adapt_query(
+                f"DELETE FROM royalty_author_months WHERE month=? AND {authors_sql}"
+            ), (month, *authors_params)))
+            statements.append((adapt_query(f"""
+                INSERT INTO royalty_author_months (author_id, month, total, books)
+                SELECT author_id, month, SUM(amount), COUNT(*) FROM royalties
+                WHERE month=? AND {authors_sql} AND book_id IS NOT NULL
+                GROUP BY author_id, month
+            """), (month, *authors_params)))
+        # 月合计从上面刚重算的作者月汇总里累加
+        statements.append((adapt_query("DELETE FROM royalty_month_totals WHERE month=?"), (month,)))
+        statements.append((adapt_query("""
+            INSERT INTO royalty_month_totals (month, total, books, authors)
+            SELECT month, SUM(total), SUM(books), COUNT(*) FROM royalty_author_months
+            WHERE month=? GROUP BY month
+        """), (month,)))
+
+    for chunk in _chunks(book_ids):
+        books_sql, books_params = in_clause("book_id", chunk)
+        statements.append((adapt_query(f"DELETE FROM royalty_book_totals WHERE {books_sql}"), books_params))
+        statements.append((adapt_query(f"""
+            INSERT INTO royalty_book_totals (book_id, author_id, total, months, last_month)
+            SELECT book_id, MAX(author_id), SUM(amount), COUNT(*), MAX(month) FROM royalties
+            WHERE {books_sql} GROUP BY book_id
+        """), books_params))
+    return statements
+
+
+def refresh(conn, keys):
+    """重算 keys 对应的汇总行（由调用方提交）"""
+    statements = refresh_statements(keys)
+    if statements:
+        execute_batch(conn, statements)
+
+
+def rebuild(conn):
+    """根据 royalties 表重建全部汇总（由调用方提交）"""
+    execute_update(conn, "DELETE FROM royalty_author_months")
+    execute_update(conn, "DELETE FROM royalty_book_totals")
+    execute_update(conn, "DELETE FROM royalty_month_totals")
+    execute_update(conn, """
+        INSERT INTO royalty_author_months (author_id, month, total, books)
+        SELECT author_id, month, SUM(amount), COUNT(*) FROM royalties
+        WHERE book_id IS NOT NULL GROUP BY author_id, month
+    """)
+    execute_update(conn, """
+        INSERT INTO royalty_book_totals (book_id, author_id, total, months, last_month)
+        SELECT book_id, MAX(author_id), SUM(amount), COUNT(*), MAX(month) FROM royalties
+        WHERE book_id IS NOT NULL GROUP BY book_id
+    """)
+    execute_update(conn, """
+        INSERT INTO royalty_month_totals (month, total, books, authors)
+        SELECT month, SUM(total), SUM(books), COUNT(*) FROM royalty_author_months GROUP BY month
+    """)
@@ -0,0 +1,163 @@
+"""慢查询日志
+
+db_hybrid 的查询函数在语句耗时达到 SLOW_QUERY_MS 毫秒时调用 record：
+- 附上执行计划：SQLite 用 EXPLAIN QUERY PLAN（不执行语句）；PostgreSQL 默认用 EXPLAIN（不执行），
+  SELECT 按 SLOW_QUERY_ANALYZE_SAMPLE 的比例改用 EXPLAIN (ANALYZE, BUFFERS) 再执行一次取得实际行数与缓冲区命中；
+  同一条（归一化后的）语句每 SLOW_QUERY_EXPLAIN_INTERVAL 秒最多取一次计划；
+- 以 JSON Lines 写入 SLOW_QUERY_LOG，超过 SLOW_QUERY_LOG_MAX_BYTES 后轮转，保留 SLOW_QUERY_LOG_BACKUPS 个旧文件。
+参数可能包含密码哈希等敏感数据，默认不写入日志，调试时可设 SLOW_QUERY_LOG_PARAMS=1。
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+
+import metrics
+
+# 阈值（毫秒），设为 0 关闭慢查询日志
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+THRESHOLD = SLOW_QUERY_MS / 1000 if SLOW_QUERY_MS > 0 else None
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "slow_queries.log"
+)
+LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "5"))
+LOG_PARAMS = os.getenv("SLOW_QUERY_LOG_PARAMS", "0") == "1"
+EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+ANALYZE_SAMPLE = float(os.getenv("SLOW_QUERY_ANALYZE_SAMPLE", "0.1"))
+
+MAX_SQL_LENGTH = 2000
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+stats = {"slow": 0, "explained": 0, "explain_errors": 0}
+_lock = threading.Lock()
+_last_explained = {}
+_logger = None
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        with _lock:
+            if _logger is None:
+                logger = logging.getLogger("slow_query")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=LOG_MAX_BYTES,
+                                              backupCount=LOG_BACKUPS, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def _should_explain(statement):
+    now = time.monotonic()
+    with _lock:
+        last = _last_explained.get(statement)
+        if last is not None and now - last < EXPLAIN_INTERVAL:
+            return False
+        if len(_last_explained) > 1000:
+            _last_explained.clear()
+        _last_explained[statement] = now
+        return True
+
+
+def _explain_sqlite(conn, query, params):
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params or ()).fetchall()
+    # 每行为 (id, parent, notused, detail)，按 parent 缩进还原树形
+    depth = {0: -1}
+    plan = []
+    for row in rows:
+        level = depth.get(row[1], -1) + 1
+        depth[row[0]] = level
+        plan.append("  " * level + row[3])
+    return plan
+
+
+def _explain_postgres(conn, query, params, analyze):
+    import psycopg2.extensions
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    # 在事务中时用保存点包住，EXPLAIN 失败不会让调用方的事务进入中止状态
+    in_tx = conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    with conn.cursor() as cur:
+        if in_tx:
+            cur.execute("SAVEPOINT slow_query_explain")
+        try:
+            cur.execute(f"EXPLAIN ({options}) {query}", params or ())
+            plan = cur.fetchone()[0]
+        except Exception:
+            if in_tx:
+                cur.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            raise
+        if in_tx:
+            cur.execute("RELEASE SAVEPOINT slow_query_explain")
+    return plan
+
+
+def _explain(conn, query, params, statement, postgres):
+    """返回 (执行计划, 是否 ANALYZE)；不需要或无法取得时返回 (None, False)"""
+    keyword = statement.split(" ", 1)[0].upper()
+    if keyword not in _EXPLAINABLE or not _should_explain(statement):
+        return None, False
+    try:
+        if postgres:
+            # ANALYZE 会真正执行语句，只对只读的 SELECT 抽样
+            analyze = keyword == "SELECT" and "FOR UPDATE" not in statement.upper() and random.random() < ANALYZE_SAMPLE
+            return _explain_postgres(conn, query, params, analyze), analyze
+        return _explain_sqlite(conn, query, params), False
+    except Exception as e:
+        with _lock:
+            stats["explain_errors"] += 1
+        return f"EXPLAIN failed: {e}", False
+
+
+def record(conn, query, params, seconds, postgres=False):
+    """记录一条慢查询；conn 为 None 时（如拼接执行的多条语句）不取执行计划"""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    statement = metrics.normalize_statement(query)
+    entry = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "duration_ms": round(seconds * 1000, 2),
+        "statement": statement,
+        "sql": " ".join(query.split())[:MAX_SQL_LENGTH],
+        "endpoint": request.endpoint if has_request_context() else None,
+        "pid": os.getpid(),
+    }
+    if LOG_PARAMS and params:
+        entry["params"] = list(params)
+    if conn is not None:
+        plan, analyzed = _explain(conn, query, params, statement, postgres)
+        if plan is not None:
+            entry["plan"] = plan
+            entry["analyzed"] = analyzed
+    with _lock:
+        stats["slow"] += 1
+        if "plan" in entry:
+            stats["explained"] += 1
+    try:
+        _get_logger().info(json.dumps(entry, ensure_ascii=False, default=str))
+    except Exception as e:
+        print(f"Failed to write slow query log: {e}")
+
+
+def read_log(path=None):
+    """按时间顺序读取日志（含轮转出的旧文件），逐条产出记录"""
+    path = path or SLOW_QUERY_LOG
+    paths = [f"{path}.{i}" for i in range(LOG_BACKUPS, 0, -1)] + [path]
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
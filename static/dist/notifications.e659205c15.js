@@ -0,0 +1,24 @@
+// 站内通知实时推送：订阅 SSE，更新顶栏未读角标；在通知页把新通知插入列表顶部
+(function () {
+	var link = document.querySelector("[data-notification-stream]");
+	if (!link || !window.EventSource) return;
+	var source = new EventSource(link.getAttribute("data-notification-stream"));
+	source.addEventListener("notification", function (e) {
+		var n = JSON.parse(e.data);
+		var badge = link.querySelector(".badge");
+		if (!badge) {
+			badge = document.createElement("span");
+			badge.className = "badge";
+			link.appendChild(badge);
+		}
+		badge.textContent = n.unread;
+		var list = document.getElementById("notification-list");
+		if (!list) return;
+		var empty = list.querySelector("[data-empty]");
+		if (empty) empty.remove();
+		var item = document.createElement("li");
+		item.className = "card";
+		item.textContent = n.message + "（" + n.created_at + "）";
+		list.insertBefore(item, list.firstChild);
+	});
+})();
@@ -0,0 +1,34 @@
+"""热点查询的索引检查：在临时 SQLite 库上执行全部迁移，再用 verify_indexes 检查执行计划"""
+import pytest
+
+import db_hybrid
+import db_migrations
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    db_hybrid.close_sqlite_conn()
+    monkeypatch.setattr(db_hybrid, "SQLITE_PATH", str(tmp_path / "test.sqlite3"))
+    db_migrations.migrate()
+    with db_hybrid.get_db() as conn:
+        yield conn
+    db_hybrid.close_sqlite_conn()
+
+
+def test_hot_path_indexes_exist(conn):
+    for name, table, _, _ in db_hybrid.HOT_PATH_INDEXES:
+        assert db_hybrid._index_exists(conn, name), f"{name} on {table} missing"
+
+
+@pytest.mark.parametrize("label", [q[0] for q in db_hybrid.HOT_PATH_QUERIES])
+def test_hot_path_query_uses_index(conn, label):
+    result = next(r for r in db_hybrid.verify_indexes(conn) if r["query"] == label)
+    assert result["ok"], result["plan"]
+    assert result["plan"].startswith(f"SEARCH {result['table']} "), result["plan"]
+
+
+def test_missing_index_is_reported(conn):
+    conn.execute("DROP INDEX idx_applications_author")
+    result = next(r for r in db_hybrid.verify_indexes(conn) if r["query"] == "author_results")
+    assert not result["ok"]
+    assert "SCAN applications" in result["plan"]
@@ -0,0 +1,62 @@
+"""密码哈希策略与校验线程池"""
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import passwords
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_needs_rehash_on_method_and_salt_length(monkeypatch):
+    stored = passwords.hash_password("pw")
+    assert not passwords.needs_rehash(stored)
+    monkeypatch.setattr(passwords, "PASSWORD_SALT_LENGTH", passwords.PASSWORD_SALT_LENGTH + 8)
+    assert passwords.needs_rehash(stored)
+    assert passwords.needs_rehash("pbkdf2:sha256:1000$salt$hash")
+
+
+def test_verify_password():
+    stored = passwords.hash_password("pw")
+    assert passwords.verify_password(stored, "pw")
+    assert not passwords.verify_password(stored, "wrong")
+
+
+def test_verify_does_not_block_gevent_hub():
+    pytest.importorskip("gevent")
+    # gevent worker 中校验在原生线程里执行，其他 greenlet（如 SSE 连接）在此期间继续运行
+    script = textwrap.dedent("""
+        from gevent import monkey
+        monkey.patch_all()
+        import os, sys, time
+        sys.path.insert(0, os.getcwd())
+        os.environ["PASSWORD_HASH_METHOD"] = "scrypt:65536:8:1"
+        import gevent
+        import passwords
+
+        stored = passwords.hash_password("pw")
+        ticks = []
+
+        def ticker():
+            while True:
+                ticks.append(time.monotonic())
+                gevent.sleep(0.005)
+
+        worker = gevent.spawn(ticker)
+        gevent.sleep(0.02)
+        started = time.monotonic()
+        for _ in range(3):
+            assert passwords.verify_password(stored, "pw")
+        elapsed = time.monotonic() - started
+        during = [t for t in ticks if t > started]
+        worker.kill()
+        # 校验期间 ticker 至少完成了一半的预期次数
+        assert len(during) >= elapsed / 0.005 / 2, (len(during), elapsed)
+        print(type(passwords._get_executor()).__module__)
+    """)
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "gevent.threadpool"
@@ -0,0 +1,101 @@
+"""作者页面的查询结果缓存
+
+按 (视图名, user_id, 额外参数) 缓存视图从数据库读出的数据，LRU 淘汰 + TTL 过期。
+管理端审核、设置稿费、删除书籍以及作者自己的写操作在提交后调用 invalidate_user；
+其他进程里的缓存不会被通知到，最多延迟一个 TTL。
+带条件GET的页面把 change_stamps 版本放进 extra，其他进程写入后版本变化即不再命中；
+代价是每次请求读取一次 change_stamps（按主键，ETag 本来就需要），换来页面本身的多条查询。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+VIEW_CACHE_SIZE = int(os.getenv("VIEW_CACHE_SIZE", "2048"))
+VIEW_CACHE_TTL = float(os.getenv("VIEW_CACHE_TTL", "60"))
+
+_entries = OrderedDict()
+# user_id -> 该用户的缓存键，失效时不需要遍历全部缓存
+_keys_by_user = {}
+# user_id -> [进行中的读取数, 读取期间的失效次数]；只保存有读取进行中的用户，读取结束即删除
+_pending = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+def _drop(key):
+    _entries.pop(key, None)
+    keys = _keys_by_user.get(key[1])
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del _keys_by_user[key[1]]
+
+
+def get_or_load(view, user_id, extra, loader):
+    """返回缓存的数据；未命中或已过期时调用 loader() 读取并写入缓存"""
+    key = (view, user_id, extra)
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry and entry[1] > now:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[0]
+        _stats["misses"] += 1
+    if VIEW_CACHE_SIZE <= 0:
+        return loader()
+
+    # 记录读取前的失效次数：读取期间该用户的数据被改写时不写入缓存，避免存入旧数据
+    with _lock:
+        pending = _pending.setdefault(user_id, [0, 0])
+        pending[0] += 1
+        generation = pending[1]
+    try:
+        value = loader()
+    finally:
+        with _lock:
+            pending[0] -= 1
+            if not pending[0]:
+                del _pending[user_id]
+    with _lock:
+        if pending[1] != generation:
+            return value
+        _entries[key] = (value, now + VIEW_CACHE_TTL)
+        _entries.move_to_end(key)
+        _keys_by_user.setdefault(user_id, set()).add(key)
+        while len(_entries) > VIEW_CACHE_SIZE:
+            _drop(next(iter(_entries)))
+            _stats["evictions"] += 1
+    return value
+
+
+def invalidate_user(user_ids, views=None):
+    """删除这些用户的缓存；views 为 None 时删除全部视图"""
+    with _lock:
+        for user_id in user_ids:
+            pending = _pending.get(user_id)
+            if pending is not None:
+                pending[1] += 1
+            for key in list(_keys_by_user.get(user_id, ())):
+                if views is None or key[0] in views:
+                    _drop(key)
+                    _stats["invalidations"] += 1
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _keys_by_user.clear()
+        for pending in _pending.values():
+            pending[1] += 1
+
+
+def stats():
+    """命中/未命中/淘汰/失效次数与当前条目数"""
+    with _lock:
+        result = dict(_stats)
+        result["size"] = len(_entries)
+    lookups = result["hits"] + result["misses"]
+    result["hit_rate"] = round(result["hits"] / lookups, 3) if lookups else None
+    return result